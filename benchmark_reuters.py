@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for news_reuters.py
+
+# Changelog
+- 1. Added extraction benchmark comparing the BeautifulSoup path (get_soup() + get_reuters_element()) with the
+     single parse lxml path (html.fromstring() + extract_article())
+  -- 1.1. runs on a directory of stored article .html files
+  -- 1.2. without a directory, article pages are generated from the records in news_dump_object.json
+- 2. Added analysis benchmark timing analyze_news() with 1, 2, 4, ... worker processes
+  -- 2.1. the records of news_dump_object.json are repeated --copies times to make a larger corpus
+  -- 2.2. checks that every worker count returns the same results as the serial analysis
+- 3. Added scorer benchmark and parity check of the batch sentiment scorer against TextBlob
+  -- 3.1. scores every sentence of the stored corpus with both, exits with status 1 if any score differs by more
+          than news_reuters.BATCH_SCORER_TOLERANCE
+- 4. Added pipeline benchmark replaying Reuters fixtures from a local HTTP server
+  -- 4.1. fixtures are recorded listing and article pages (see record_fixtures()) or generated from the records in
+          news_dump_object.json, served with a configurable latency and jitter
+  -- 4.2. times the listing, link filtering, fetch, parse, store and analysis stages and prints the timings as JSON
+
+Usage:
+    python benchmark_reuters.py extraction [--html-dir DIR] [--repeat N]
+    python benchmark_reuters.py analysis [--copies N] [--max-workers N] [--chunk-size N]
+    python benchmark_reuters.py scorer [--news-object FILE]
+    python benchmark_reuters.py pipeline [--fixtures DIR] [--copies N] [--latency S] [--jitter S] [--output FILE]
+    python benchmark_reuters.py record DIR [--pages N]
+"""
+
+# Import libraries
+import argparse
+import glob
+import html as html_escape
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import pandas as pd
+
+# Import methods
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from lxml import html
+
+import news_reuters
+
+
+"""
+ARTICLE FIXTURES
+"""
+
+# Reuters article page template
+# Mirrors the structure the extraction rules expect, with some page furniture around it so the parsers do
+# a realistic amount of work
+ARTICLE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title} | Reuters</title>
+<link rel="stylesheet" href="/styles/main.css"><script src="/scripts/main.js"></script></head>
+<body><header><nav>{nav}</nav></header>
+<div class="StandardArticle_inner-container">
+<div class="ArticleHeader_content-container">
+<h1 class="ArticleHeader_headline">{title}</h1>
+<div class="ArticleHeader_date">{date} /  {time} / Updated 2 hours ago</div>
+</div>
+<div class="StandardArticleBody_body">{paragraphs}</div>
+</div>
+<aside>{related}</aside>
+<footer>{nav}</footer></body></html>
+'''
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+
+
+# build article html
+# Turns a stored news record back into a Reuters style article page
+def article_html(record):
+    date = pd.Timestamp(record['date'])
+    nav = ''.join('<a href="/news/section-{0}">Section {0}</a>'.format(i) for i in range(40))
+    related = ''.join('<div class="related"><a href="/article/related-{0}">Related story {0}</a></div>'.format(i)
+                      for i in range(10))
+    paragraphs = ''.join('<p>' + html_escape.escape(sentence.strip()) + '.</p>'
+                         for sentence in record['Text'].split('. ') if sentence.strip())
+    return ARTICLE_TEMPLATE.format(title=html_escape.escape(record['Title']), nav=nav, related=related,
+                                   date=MONTHS[date.month - 1] + ' ' + str(date.day) + ', ' + str(date.year),
+                                   time=record['time'], paragraphs=paragraphs)
+
+
+# load article pages
+# Returns a list of (url, html text) pairs, read from html_dir or generated from news_object_file
+def load_article_pages(html_dir=None, news_object_file='news_dump_object.json'):
+    if html_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(html_dir, '*.html'))):
+            with open(path, 'r', encoding='utf-8') as in_file:
+                pages.append(('file://' + os.path.abspath(path), in_file.read()))
+        return pages
+    news_df = pd.read_json(news_object_file)
+    return [(record['url'], article_html(record)) for record in news_df.to_dict('records')]
+
+
+# Listing page template
+# A theWire listing page with relative article links like the paginated layout introduced on 19 May 2020
+LISTING_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>The Wire | Reuters</title></head>
+<body><header><nav>{nav}</nav></header>
+<section class="news-headline-list">{stories}</section>
+<footer><a href="/theWire?view=page&amp;page={next_page}&amp;pageSize=10">Next</a>{nav}</footer></body></html>
+'''
+LISTING_PATH = '/theWire?view=page&page={page}&pageSize=10'
+LISTING_PAGE_SIZE = 10
+
+
+# listing page html
+def listing_html(paths, page):
+    nav = ''.join('<a href="/news/section-{0}">Section {0}</a>'.format(i) for i in range(40))
+    stories = ''.join('<article class="story"><div class="story-content"><a href="{0}"><h3 class="story-title">'
+                      'Story {1}</h3></a></div></article>'.format(html_escape.escape(path), n)
+                      for n, path in enumerate(paths))
+    return LISTING_TEMPLATE.format(nav=nav, stories=stories, next_page=page + 1)
+
+
+# synthetic fixtures
+# Returns a dict of request path (with query) to page bytes: the article pages of the records in news_object_file,
+# repeated copies times under distinct paths, and the listing pages linking to them
+def synthetic_fixtures(news_object_file='news_dump_object.json', copies=1):
+    news_df = pd.read_json(news_object_file)
+    fixtures = {}
+    paths = []
+    for copy in range(copies):
+        for record in news_df.to_dict('records'):
+            path = urlparse(record['url']).path
+            if copy:
+                path += '-copy' + str(copy)
+            fixtures[path] = article_html(record).encode('utf-8')
+            paths.append(path)
+    for page in range(1, math.ceil(len(paths) / LISTING_PAGE_SIZE) + 1):
+        page_paths = paths[(page - 1) * LISTING_PAGE_SIZE:page * LISTING_PAGE_SIZE]
+        fixtures[LISTING_PATH.format(page=page)] = listing_html(page_paths, page).encode('utf-8')
+    return fixtures
+
+
+# Record fixtures
+# Downloads listing pages 1..pages and their articles from reuters.com into fixture_dir, with a manifest.json of
+# request path to file name
+def record_fixtures(fixture_dir, pages=news_reuters.LISTING_PAGES):
+    os.makedirs(fixture_dir, exist_ok=True)
+    manifest = {}
+
+    def save(url, content):
+        parsed = urlparse(url)
+        path = parsed.path + ('?' + parsed.query if parsed.query else '')
+        name = 'page-%05d.html' % len(manifest)
+        with open(os.path.join(fixture_dir, name), 'wb') as out_file:
+            out_file.write(content)
+        manifest[path] = name
+
+    links = []
+    for page in range(1, pages + 1):
+        url = news_reuters.REUTERS_LISTING_PAGE_URL.format(page=page)
+        response = news_reuters.fetch(url)
+        if response.status_code == 200:
+            save(url, response.content)
+            links.extend(news_reuters.get_soup_links(news_reuters.get_soup(response.text)))
+    for article in news_reuters.get_articles_reuters(list(dict.fromkeys(links)), set()):
+        response = news_reuters.fetch(article)
+        if response.status_code == 200:
+            save(article, response.content)
+    with open(os.path.join(fixture_dir, 'manifest.json'), 'w', encoding='utf-8') as out_file:
+        json.dump(manifest, out_file, indent=1)
+    print(len(manifest), 'pages recorded in', fixture_dir)
+
+
+# load fixtures
+# Returns the recorded fixtures of fixture_dir as a dict of request path to page bytes
+def load_fixtures(fixture_dir):
+    with open(os.path.join(fixture_dir, 'manifest.json'), 'r', encoding='utf-8') as in_file:
+        manifest = json.load(in_file)
+    fixtures = {}
+    for path, name in manifest.items():
+        with open(os.path.join(fixture_dir, name), 'rb') as in_file:
+            fixtures[path] = in_file.read()
+    return fixtures
+
+
+"""
+FIXTURE SERVER
+"""
+
+
+# fixture request handler
+# Serves the fixtures of its server after a delay of latency +/- jitter seconds, unknown paths get a 404
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        with server.random_lock:
+            delay = server.latency + server.random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        body = server.fixtures.get(self.path)
+        self.send_response(200 if body is not None else 404)
+        body = body if body is not None else b'Not found'
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start fixture server
+# Serves fixtures on a free local port from a background thread, returns the server and its base URL
+def start_fixture_server(fixtures, latency=0.0, jitter=0.0, seed=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.daemon_threads = True
+    server.fixtures = fixtures
+    server.latency = latency
+    server.jitter = jitter
+    server.random = random.Random(seed)
+    server.random_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_address[1]
+
+
+"""
+BENCHMARKS
+"""
+
+
+# time a function over all pages
+# Returns the best total time of repeat runs and the records of the last run
+def time_pages(extract, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = [extract(text, url) for url, text in pages]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, records
+
+
+# BeautifulSoup extraction path, as used before the extraction engine
+def extract_soup(text, url):
+    return news_reuters.get_reuters_element(news_reuters.get_soup(text), url)
+
+
+# lxml extraction path
+def extract_lxml(text, url):
+    return news_reuters.extract_article(html.fromstring(text.encode('utf-8')), url)
+
+
+# Extraction benchmark
+# Prints the time per article of both paths and whether they extracted the same records
+def bench_extraction(html_dir=None, repeat=3):
+    pages = load_article_pages(html_dir)
+    if not pages:
+        print('No article pages found')
+        return
+    soup_time, soup_records = time_pages(extract_soup, pages, repeat)
+    lxml_time, lxml_records = time_pages(extract_lxml, pages, repeat)
+    mismatches = sum(1 for a, b in zip(soup_records, lxml_records) if a != b)
+    print(len(pages), 'article pages, best of', repeat, 'runs')
+    print('BeautifulSoup: {:.2f} ms/article'.format(1000 * soup_time / len(pages)))
+    print('lxml XPath:    {:.2f} ms/article'.format(1000 * lxml_time / len(pages)))
+    print('Speedup:       {:.1f}x'.format(soup_time / lxml_time))
+    print('Mismatched records:', mismatches)
+
+
+# Analysis benchmark
+# Prints the analysis time for each worker count, the sentiment cache is off so every run scores all sentences
+def bench_analysis(copies=10, max_workers=None, chunk_size=32, news_object_file='news_dump_object.json'):
+    max_workers = max_workers or os.cpu_count() or 1
+    news_df = pd.concat([pd.read_json(news_object_file)] * copies, ignore_index=True)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_file = os.path.join(temp_dir, 'news_corpus.json')
+        news_df.to_json(corpus_file, date_format='iso')
+        print(len(news_df), 'articles,', chunk_size, 'articles per chunk')
+        serial_time, serial_results = None, None
+        workers = 1
+        while workers <= max_workers:
+            start = time.perf_counter()
+            results = news_reuters.analyze_news(corpus_file, cache=False, workers=workers, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - start
+            if serial_results is None:
+                serial_time, serial_results = elapsed, results
+            print('{:>3} workers: {:.2f} s, speedup {:.1f}x, same results: {}'.format(
+                workers, elapsed, serial_time / elapsed, results == serial_results))
+            workers *= 2
+
+
+# Scorer benchmark
+# Prints the time per sentence of TextBlob and the batch scorer and the largest score difference between them
+# Returns True if every score is within news_reuters.BATCH_SCORER_TOLERANCE
+def bench_scorer(news_object_file='news_dump_object.json'):
+    import numpy as np
+    from textblob import TextBlob
+    records = news_reuters.iter_news_records(news_object_file)
+    sentences = [sentence for _, sentence in news_reuters.iter_sentences(records, include_title=True)]
+    if not sentences:
+        print('No sentences found')
+        return True
+    news_reuters.get_batch_lexicon()
+    start = time.perf_counter()
+    expected = np.array([tuple(TextBlob(sentence).sentiment) for sentence in sentences])
+    textblob_time = time.perf_counter() - start
+    start = time.perf_counter()
+    polarity, subjectivity = news_reuters.score_batch(sentences)
+    batch_time = time.perf_counter() - start
+    difference = max(np.abs(expected[:, 0] - polarity).max(), np.abs(expected[:, 1] - subjectivity).max())
+    mismatches = int(((np.abs(expected[:, 0] - polarity) > news_reuters.BATCH_SCORER_TOLERANCE)
+                      | (np.abs(expected[:, 1] - subjectivity) > news_reuters.BATCH_SCORER_TOLERANCE)).sum())
+    print(len(sentences), 'sentences')
+    print('TextBlob:     {:.3f} ms/sentence'.format(1000 * textblob_time / len(sentences)))
+    print('Batch scorer: {:.3f} ms/sentence'.format(1000 * batch_time / len(sentences)))
+    print('Speedup:      {:.1f}x'.format(textblob_time / batch_time))
+    print('Largest difference:', difference, '(tolerance', str(news_reuters.BATCH_SCORER_TOLERANCE) + ')')
+    print('Sentences outside tolerance:', mismatches)
+    return mismatches == 0
+
+
+# fetch article
+# iter_html_reuters() loader that only downloads, returns the page bytes or None
+def fetch_article(article, max_per_host):
+    try:
+        with news_reuters.get_host_semaphore(article, max_per_host):
+            return news_reuters.fetch(article).content
+    except news_reuters.requests.RequestException:
+        return None
+
+
+# stage timer
+# Runs fn(), stores its time and item count under name in stages and returns its result
+def time_stage(stages, name, fn, count=len):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    items = count(result)
+    stages[name] = {'seconds': elapsed, 'items': items, 'per_second': items / elapsed if elapsed else None}
+    return result
+
+
+# Pipeline benchmark
+# Runs the scraper stages against the fixture server and returns the timings of each stage as a dict
+# parse is the BeautifulSoup path (get_reuters_elements()), parse_lxml the extraction main() uses
+def bench_pipeline(fixture_dir=None, copies=1, latency=0.05, jitter=0.02, pages=None, max_workers=8, max_per_host=4,
+                   seed=0):
+    fixtures = load_fixtures(fixture_dir) if fixture_dir else synthetic_fixtures(copies=copies)
+    listing_pages = sum(1 for path in fixtures if path.startswith('/theWire'))
+    pages = min(pages or listing_pages, listing_pages)
+    server, base_url = start_fixture_server(fixtures, latency, jitter, seed)
+    stages = {}
+    start_stats = news_reuters.get_fetch_stats()
+    start = time.perf_counter()
+    try:
+        links = time_stage(stages, 'listing', lambda: news_reuters.get_listing_links_http(
+            base_url + LISTING_PATH, pages, max_workers))
+        articles = time_stage(stages, 'filter', lambda: news_reuters.get_articles_reuters(links, set(), base_url))
+        pages_out = time_stage(stages, 'fetch', lambda: [
+            (article, content) for article, content in news_reuters.iter_html_reuters(
+                articles, max_workers, max_per_host, loader=fetch_article) if content is not None])
+        stages['fetch']['bytes'] = sum(len(content) for _, content in pages_out)
+        time_stage(stages, 'parse', lambda: news_reuters.get_reuters_elements(
+            [news_reuters.get_soup(content.decode('utf-8')) for _, content in pages_out],
+            [article for article, _ in pages_out]))
+        records = time_stage(stages, 'parse_lxml', lambda: [
+            record for record in (news_reuters.extract_article(html.fromstring(content), article)
+                                  for article, content in pages_out) if record is not None])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store_dir = os.path.join(temp_dir, 'news_store')
+            time_stage(stages, 'store', lambda: news_reuters.write_segment(store_dir, records) and records)
+            time_stage(stages, 'analysis', lambda: news_reuters.analyze_news(store_dir, cache=False),
+                       count=lambda results: sum(len(result['sentences']) for result in results.values()))
+    finally:
+        server.shutdown()
+        server.server_close()
+    stats = news_reuters.get_fetch_stats()
+    return {
+        'benchmark': 'pipeline',
+        'time': datetime_now(),
+        'python': platform.python_version(),
+        'settings': {'fixtures': fixture_dir or 'synthetic', 'copies': 1 if fixture_dir else copies,
+                     'latency': latency, 'jitter': jitter, 'pages': pages, 'max_workers': max_workers,
+                     'max_per_host': max_per_host, 'seed': seed},
+        'stages': stages,
+        'total_seconds': time.perf_counter() - start,
+        'http': {key: stats[key] - start_stats[key] for key in ['requests', 'retries', 'failures']},
+    }
+
+
+# current UTC time as an ISO 8601 string
+def datetime_now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+"""
+EXECUTE SCRIPT
+"""
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for news_reuters.py')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    extraction_parser = subparsers.add_parser('extraction', help='compare BeautifulSoup and lxml extraction')
+    extraction_parser.add_argument('--html-dir', help='directory of stored article .html files')
+    extraction_parser.add_argument('--repeat', type=int, default=3)
+    analysis_parser = subparsers.add_parser('analysis', help='time the text analysis with several worker counts')
+    analysis_parser.add_argument('--copies', type=int, default=10, help='times the stored articles are repeated')
+    analysis_parser.add_argument('--max-workers', type=int, help='largest worker count (default: CPU count)')
+    analysis_parser.add_argument('--chunk-size', type=int, default=32)
+    scorer_parser = subparsers.add_parser('scorer', help='compare the batch sentiment scorer with TextBlob')
+    scorer_parser.add_argument('--news-object', default='news_dump_object.json',
+                               help='news object or store to take the sentences from')
+    pipeline_parser = subparsers.add_parser('pipeline', help='time the scraper stages against a local server')
+    pipeline_parser.add_argument('--fixtures', help='directory of recorded fixtures (default: generated)')
+    pipeline_parser.add_argument('--copies', type=int, default=1, help='times the generated articles are repeated')
+    pipeline_parser.add_argument('--pages', type=int, help='listing pages to read (default: all)')
+    pipeline_parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    pipeline_parser.add_argument('--jitter', type=float, default=0.02, help='random +/- seconds on the latency')
+    pipeline_parser.add_argument('--max-workers', type=int, default=8)
+    pipeline_parser.add_argument('--max-per-host', type=int, default=4)
+    pipeline_parser.add_argument('--seed', type=int, default=0)
+    pipeline_parser.add_argument('--output', help='write the JSON results to this file instead of printing them')
+    record_parser = subparsers.add_parser('record', help='record Reuters listing and article pages as fixtures')
+    record_parser.add_argument('fixture_dir')
+    record_parser.add_argument('--pages', type=int, default=news_reuters.LISTING_PAGES)
+    args = parser.parse_args()
+    if args.benchmark == 'extraction':
+        bench_extraction(args.html_dir, args.repeat)
+    elif args.benchmark == 'analysis':
+        bench_analysis(args.copies, args.max_workers, args.chunk_size)
+    elif args.benchmark == 'scorer':
+        if not bench_scorer(args.news_object):
+            sys.exit(1)
+    elif args.benchmark == 'pipeline':
+        results = bench_pipeline(args.fixtures, args.copies, args.latency, args.jitter, args.pages, args.max_workers,
+                                 args.max_per_host, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as out_file:
+                json.dump(results, out_file, indent=1)
+        else:
+            print(json.dumps(results, indent=1))
+    elif args.benchmark == 'record':
+        record_fixtures(args.fixture_dir, args.pages)
+    else:
+        parser.print_help()
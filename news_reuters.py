@@ -22,27 +22,188 @@ Created on Sat Jul 13 15:23:39 2019
 - 5. Updated on 19 May to support modified https://www.reuters.com/theWire webpage
   -- New webpage is no longer an infinite scroll page and links are relative vs absolute
 
+- 6. get_html_reuters() fetches articles concurrently using a bounded thread pool
+  -- 6.1. max_workers sets the global number of concurrent downloads (1 restores the old serial behaviour)
+  -- 6.2. max_per_host limits the number of concurrent downloads against any single host
+  -- 6.3. soups are returned in the same order as the articles list so get_reuters_elements() still pairs by index
+
+- 7. Added a shared HTTP session (see HTTP FUNCTIONS) used by get_html(), get_html_reuters() and check_chrome()
+  -- 7.1. connections are pooled and kept alive between requests instead of opening a new connection per article
+  -- 7.2. connection errors, timeouts and 429/5xx responses are retried with exponential backoff and jitter
+  -- 7.3. a Retry-After header sent by the server is honored before retrying
+  -- 7.4. get_fetch_stats() reports request, retry, failure and connection reuse counters
+
+- 8. get_html_scroll() no longer sleeps a fixed 8+ seconds per page
+  -- 8.1. the page is returned as soon as the article links are present and their count has stopped changing
+  -- 8.2. max_wait sets the deadline after which whatever has loaded is returned
+  -- 8.3. lean browser profile (default) blocks images, fonts, stylesheets and ad/tracking hosts
+  -- 8.4. main(listing_wait=..., lean_browser=...) passes max_wait and lean on to the browser listing
+
+- 9. The theWire listing is fetched over plain HTTP by default, no browser is started
+  -- 9.1. listing_pages pages of the paginated listing are downloaded concurrently with fetch()
+  -- 9.2. listing='browser' restores the selenium listing, it is also used as a fallback when the HTTP listing has no article links
+  -- 9.3. check_chrome() is only called when the browser listing is actually used
+
+- 10. Webdrivers are kept in a pool (see BROWSER POOL) instead of starting a new browser for every page
+  -- 10.1. idle browsers are health checked before reuse and replaced if they no longer respond
+  -- 10.2. the pool is reused across listing pages and across main() calls in the same process
+  -- 10.3. main(keep_browser=False) or cleanup() shuts the pooled browsers down, they are also closed at exit
+
+- 11. check_chrome() installs the chrome driver into a versioned cache instead of the current working directory
+  -- 11.1. cache is keyed by OS, architecture and driver version (CHROMEDRIVER_VERSION by default)
+  -- 11.2. downloads are checked against the MD5 the storage server sends (x-goog-hash), archives against
+           CHROMEDRIVER_SHA256 (or sha256=) and the digest recorded when they were downloaded, then installed with
+           an atomic rename
+  -- 11.3. a local archive (archive= or $NEWS_REUTERS_CHROMEDRIVER_ARCHIVE) is installed without using the network
+  -- 11.4. cleanup() no longer deletes the chrome driver
+
+- 12. Articles are streamed through fetch -> parse -> extract -> save instead of holding every soup in memory
+  -- 12.1. iter_reuters() yields one record per article as soon as it is extracted, the soup is dropped right after
+  -- 12.2. at most window articles are downloaded or waiting to be extracted at any time
+  -- 12.3. main() saves every flush_every records, and saves what it has if interrupted (Ctrl+C)
+  -- 12.4. main() only holds the records it has not saved yet, with the store its output is read back from the
+           store and main(return_output=False) skips it
+
+- 13. Articles are parsed once with lxml and extracted with compiled XPath rules (see EXTRACTION FUNCTIONS)
+  -- 13.1. replaces the second html.parser pass in get_soup() and the three find_all() scans per article
+  -- 13.2. rules are kept per source in EXTRACTION_RULES so new layouts only need new expressions
+  -- 13.3. benchmark_reuters.py compares the new extraction with the BeautifulSoup path on stored article HTML
+
+- 14. News is kept in an append-only store of JSON Lines segments (see NEWS STORE) instead of one JSON file
+  -- 14.1. each save writes only the new articles to a new segment file, written to a temporary file and renamed
+  -- 14.2. segments are merged into one base file once there are more than STORE_COMPACT_SEGMENTS of them
+  -- 14.3. an existing news_dump_object.json is migrated into the store the first time main() runs
+  -- 14.4. the store lives in [filename]_store next to the JSON file, load_store() opens it as a dataframe
+           and export_news_object() writes it back out in the old JSON format
+  -- 14.5. main(storage='json') keeps the old behaviour of rewriting the JSON file
+  -- 14.6. with the store main() returns the JSON of the newly scraped articles only
+
+- 15. Every store file has a sidecar URL index (.urls) so startup reads URLs only, never article text
+  -- 15.1. the index is written with each segment and each compaction, a missing index is rebuilt from its file
+  -- 15.2. main(url_index='bloom') checks new links against a Bloom filter of the stored URLs (urls.bloom)
+           instead of loading the URL index, the URLs the filter has seen are confirmed against the URL index
+
+- 16. The text analysis no longer runs when the module is imported
+  -- 16.1. analyze_news() runs it and returns the results per entity, print_analysis() prints them as before
+  -- 16.2. running news_reuters.py as a script still scrapes and then prints the analysis
+  -- 16.3. pandas, numpy, textblob and selenium are imported by the functions that use them
+
+- 17. analyze_news() finds the topic and every entity in one pass over the sentences
+  -- 17.1. match_sentence() finds the entities of each topic sentence with one multi-pattern matcher (see
+           build_matcher()) as iter_matches() streams the sentences
+  -- 17.2. each sentence's sentiment is computed at most once and shared by all the entities it mentions
+
+- 18. The analysis reads the stored article Text (and optionally Title) fields instead of the raw JSON file
+  -- 18.1. articles are streamed one at a time from the news store, or from the JSON news object if there is no store
+  -- 18.2. every analysed sentence keeps the url and date of its article
+
+- 19. Sentence splits and sentiment scores are cached on disk (see SENTIMENT CACHE)
+  -- 19.1. entries are keyed by a hash of the text and the analyzer version, so re-runs only process new text
+  -- 19.2. changing SENTIMENT_CACHE_VERSION or the textblob version invalidates the cache
+  -- 19.3. analyze_news() prints cache hits and misses, get_sentiment_cache_stats() returns them
+
+- 20. analyze_news(workers=N) splits and scores articles in N processes
+  -- 20.1. articles are sent to the workers in chunks of chunk_size and merged back in article order,
+           so the results are identical to the serial analysis
+  -- 20.2. workers only read the sentiment cache, their new entries are written by the main process
+  -- 20.3. benchmark_reuters.py analysis times the analysis for several worker counts
+
+- 21. Added a batch sentiment scorer, analyze_news(scorer='batch')
+  -- 21.1. TextBlob's pattern lexicon is compiled into NumPy arrays and a batch of sentences is scored at once
+  -- 21.2. sentences with negations, exclamation marks or emoticons are scored with the same rules word by word
+  -- 21.3. scores match TextBlob within BATCH_SCORER_TOLERANCE, benchmark_reuters.py scorer checks the stored corpus
+
+- 22. Added analysis_frame() and aggregate_analysis()
+  -- 22.1. analysis_frame() holds the analyze_news() results in one table, a row per entity mention with its
+           sentence, article url, date, polarity, subjectivity and sentiment (polarity * subjectivity)
+  -- 22.2. aggregate_analysis() returns mentions and mean scores per entity and time bucket (day, week, month, ...)
+
+- 23. Added analysis aggregates kept in the news store (aggregates.json)
+  -- 23.1. count, sum and sum of squares of polarity, subjectivity and sentiment per entity per day, the sums are
+           exact fractions so the totals do not depend on the order the articles were added in
+  -- 23.2. main(aggregates=True) adds the newly scraped articles to them each time the store is saved
+  -- 23.3. aggregates_frame() reports from them without re-running the analysis
+  -- 23.4. python news_reuters.py rebuild-aggregates rebuilds them from the whole store
+
+- 24. Added near duplicate detection (MinHash signatures of Title and Text shingles with an LSH index)
+  -- 24.1. main(duplicates='flag') gives near duplicates of earlier articles a duplicate_of field with the URL of
+           the original, duplicates='collapse' also drops their Text
+  -- 24.2. the store keeps the signatures in minhash.jsonl so they are not recomputed on every run
+  -- 24.3. python news_reuters.py dedupe [--collapse] flags the duplicates already in the store
+  -- 24.4. the text analysis and the aggregates skip articles flagged as duplicates
+
+- 25. Added a full text search index of the news store (SQLite FTS5 in search.sqlite)
+  -- 25.1. search_news() returns the best matching articles by BM25 with a snippet, optionally between two dates
+           and for one source
+  -- 25.2. main(search_index=True) indexes the new articles each time the store is saved, articles missing from
+           the index are added whenever it is opened
+  -- 25.3. python news_reuters.py search QUERY searches from the command line
+
+- 26. Added run metrics to main()
+  -- 26.1. time spent per stage (load, listing, filter, fetch, parse, store, ...), bytes downloaded, pages per
+           second, URLs skipped as already stored, near duplicates and failures by stage and reason
+  -- 26.2. main(with_metrics=True) returns (output, metrics), metrics_file= writes them as JSON or, for a .prom
+           file, in the Prometheus text format (see metrics_json() and metrics_prometheus())
+  -- 26.3. extract_article() and get_reuters_element() report which field could not be decoded
+
+- 27. Added a profiling mode, main(profile_dir=...) or python news_reuters.py --profile DIR
+  -- 27.1. every stage (see run_stage()) is profiled with cProfile and traced with tracemalloc while it runs
+  -- 27.2. writes a .prof file (pstats, snakeviz) and a .collapsed file (flamegraph.pl, speedscope) per stage, the
+           tracemalloc difference over the first run of each stage and a memory.json summary
+  -- 27.3. when profiling is off a stage only adds its time to the run metrics
+
+- 28. Added a raw HTML archive of the article pages, main(archive=True)
+  -- 28.1. pages are appended to pages.warc.gz in the news store, a WARC response record per gzip member, with an
+           index by URL in pages.idx
+  -- 28.2. python news_reuters.py reextract extracts the archived pages again in parallel without the network and
+           updates the store, e.g. after the EXTRACTION_RULES were fixed for new Reuters class names
+
+- 29. Added an HTTP cache with conditional requests, main(http_cache=True)
+  -- 29.1. responses with an ETag or Last-Modified header are kept in http_cache.sqlite in the cache dir and
+           requested again with If-None-Match / If-Modified-Since, a 304 answer is served from the cache
+  -- 29.2. the cache is kept under HTTP_CACHE_MAX_BYTES by removing the least recently used responses
+  -- 29.3. the run metrics count the responses served from the cache (not_modified)
+
 """
 
 # News Scrape
 
 # Import libraries
-import selenium.webdriver as webdriver
+# pandas, numpy, textblob and selenium are slow to import and are imported by the functions that need them
 import time
 import requests
-import pandas as pd
 import os
-import urllib.request
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote as urllib_quote
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from collections import deque
 import zipfile
 import platform
+import hashlib
+import shutil
+import tempfile
 import base64
-from textblob import TextBlob
-import numpy as np
+import threading
+import random
+import atexit
+import json
+import math
+import re
+import sqlite3
+import gzip
+import uuid
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
 
 # Import methods
-from selenium.webdriver.chrome.options import Options
-from lxml import html
+from requests.adapters import HTTPAdapter
+from lxml import html, etree
 from bs4 import BeautifulSoup
 
 
@@ -59,6 +220,7 @@ GENERAL FUNCTIONS
 # Pandas library is used to open the JSON file as a dataframe and access the set of URLs
 # Code provides basic format checking of input file based on the "url" column if that column does not exist program crashes with exception warning
 def open_file(news_object_path, news_object_file):
+    import pandas as pd
     news_object_file = os.path.join(news_object_path, news_object_file)
     try:
         old_news_df = pd.read_json(news_object_file)
@@ -74,65 +236,749 @@ def open_file(news_object_path, news_object_file):
     return old_news_df, old_url_set
 
 
+# iterate ordered
+# Runs fn over items with executor and yields (item, result) pairs in the order of items
+# At most window items are submitted and not yet consumed at any time, cancelled ones are dropped on exit
+def iter_ordered(executor, fn, items, window):
+    items = iter(items)
+    pending = deque()
+    try:
+        for item in islice(items, max(window, 1)):
+            pending.append((item, executor.submit(fn, item)))
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            for next_item in islice(items, 1):
+                pending.append((next_item, executor.submit(fn, next_item)))
+            yield item, result
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
 # url check
+# old_url_set may be any container of URLs, e.g. a set or a UrlIndex
 def url_check(old_url_set, url):
     scheme = urlparse(url) # parses the url into parts
-    url_set = {url}
-    test_set = old_url_set & url_set
-    if len(test_set) == 0 and scheme.scheme: # Fixed parse error added scheme validation, will not process urls without scheme i.e. url missin 'https://'
+    if url not in old_url_set and scheme.scheme: # Fixed parse error added scheme validation, will not process urls without scheme i.e. url missin 'https://'
         check = False
     else:
         check = True
     return check
 
 
+"""
+HTTP FUNCTIONS
+"""
+
+# HTTP settings
+# Every download goes through fetch(), which shares one pooled requests.Session between all threads
+# Responses with a status in RETRY_STATUS, connection errors and timeouts are retried up to RETRY_TOTAL times
+# The wait before retry n is a random value between 0 and RETRY_BACKOFF * 2**n seconds (capped at RETRY_BACKOFF_MAX)
+# unless the server sends a Retry-After header, which is honored up to RETRY_AFTER_MAX seconds
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 16
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 30
+RETRY_AFTER_MAX = 120
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+http_session = None
+http_lock = threading.Lock()
+fetch_stats = {'requests': 0, 'retries': 0, 'failures': 0, 'bytes': 0, 'not_modified': 0}
+
+
+# get session
+# Creates the shared session on first use, the adapter keeps up to HTTP_POOL_SIZE connections alive per host
+def get_session():
+    global http_session
+    with http_lock:
+        if http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            http_session = session
+    return http_session
+
+
+# count a fetch event
+def count_fetch(counter, amount=1):
+    with http_lock:
+        fetch_stats[counter] += amount
+
+
+# retry delay
+# Returns the number of seconds to wait before the next attempt
+# Retry-After may be given as a number of seconds or as an HTTP date
+def retry_delay(attempt, response=None, backoff=RETRY_BACKOFF):
+    retry_after = None
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), RETRY_AFTER_MAX)
+    return random.uniform(0, min(backoff * 2 ** attempt, RETRY_BACKOFF_MAX))
+
+
+# fetch url
+# Downloads url with the shared session, retrying transient failures
+# After the last attempt a retryable status is returned to the caller and a connection error is raised
+# Updated to send conditional requests for the responses in the HTTP cache when it is open (see open_http_cache())
+def fetch(url, retries=RETRY_TOTAL, backoff=RETRY_BACKOFF, timeout=HTTP_TIMEOUT):
+    session = get_session()
+    headers = conditional_headers(url) if http_cache else None
+    attempt = 0
+    while True:
+        count_fetch('requests')
+        try:
+            response = session.get(url, timeout=timeout, headers=headers)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= retries:
+                count_fetch('failures')
+                raise
+            delay = retry_delay(attempt, backoff=backoff)
+        else:
+            if response.status_code == 304 and headers:
+                cached = cached_response(url, response)
+                if cached is not None:
+                    count_fetch('not_modified')
+                    return cached
+                # the response was evicted in the meantime, ask again without validators
+                headers = None
+                continue
+            if response.status_code not in RETRY_STATUS:
+                count_fetch('bytes', len(response.content))
+                if http_cache:
+                    cache_response(url, response)
+                return response
+            if attempt >= retries:
+                count_fetch('failures')
+                return response
+            delay = retry_delay(attempt, response, backoff)
+            response.close()
+        count_fetch('retries')
+        attempt += 1
+        time.sleep(delay)
+
+
+# get fetch stats
+# Returns a copy of the fetch counters along with the connection pool counters, 'bytes' counts the downloaded bodies
+# and 'not_modified' the responses served from the HTTP cache
+# 'connections' is the number of connections opened and 'reused' the number of requests that reused one
+def get_fetch_stats():
+    with http_lock:
+        stats = dict(fetch_stats)
+        session = http_session
+    connections = 0
+    pool_requests = 0
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                connections += pool.num_connections
+                pool_requests += pool.num_requests
+    stats['connections'] = connections
+    stats['reused'] = max(pool_requests - connections, 0)
+    return stats
+
+
+"""
+HTTP CACHE
+"""
+
+# HTTP cache settings
+# main(http_cache=True) keeps the responses that carry an ETag or a Last-Modified header in a SQLite database in the
+# cache dir (see get_cache_dir()). fetch() then asks for a cached URL with If-None-Match / If-Modified-Since and
+# answers a 304 Not Modified with the cached body, so an unchanged page costs one request without a body.
+# Responses marked Cache-Control: no-store are not kept. The cached bodies are kept under HTTP_CACHE_MAX_BYTES by
+# removing the least recently used responses.
+# Bodies are stored decoded, STORED_DROP_HEADERS are dropped from the stored headers (also see warc_record())
+HTTP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+STORED_DROP_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+http_cache = {}
+
+
+# HTTP cache path
+def get_http_cache_path(cache_path=None):
+    return cache_path or os.path.join(get_cache_dir(), 'http_cache.sqlite')
+
+
+# Open HTTP cache
+# Starts caching the responses of fetch() in the cache database, returns False if the cache was already open
+def open_http_cache(cache_path=None, max_bytes=HTTP_CACHE_MAX_BYTES):
+    if http_cache:
+        return False
+    cache_path = get_http_cache_path(cache_path)
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    connection = sqlite3.connect(cache_path, check_same_thread=False)
+    connection.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                       'headers TEXT, body BLOB, size INTEGER, used REAL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+    size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+    http_cache.update({'connection': connection, 'lock': threading.Lock(), 'max_bytes': max_bytes, 'size': size})
+    with http_cache['lock']:
+        evict_http_cache()
+    return True
+
+
+# Close HTTP cache
+# Commits the cached responses
+def close_http_cache():
+    if not http_cache:
+        return
+    with http_cache['lock']:
+        http_cache['connection'].commit()
+        http_cache['connection'].close()
+    http_cache.clear()
+
+
+# Evict HTTP cache
+# Removes the least recently used responses until the cached bodies fit in max_bytes, the caller holds the lock
+def evict_http_cache():
+    connection = http_cache['connection']
+    if http_cache['size'] <= http_cache['max_bytes']:
+        return
+    evicted = []
+    for url, size in connection.execute('SELECT url, size FROM responses ORDER BY used'):
+        if http_cache['size'] <= http_cache['max_bytes']:
+            break
+        evicted.append((url,))
+        http_cache['size'] -= size
+    connection.executemany('DELETE FROM responses WHERE url = ?', evicted)
+
+
+# conditional headers
+# Returns the validators of the cached response of url as If-None-Match / If-Modified-Since headers, or None
+def conditional_headers(url):
+    with http_cache['lock']:
+        row = http_cache['connection'].execute('SELECT etag, last_modified FROM responses WHERE url = ?',
+                                               (url,)).fetchone()
+    if row is None:
+        return None
+    etag, last_modified = row
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+# cached response
+# Returns the cached response of url as the 200 response it was, None if it has been evicted
+# not_modified is the 304 answer, its request is kept as the request of the response
+def cached_response(url, not_modified):
+    with http_cache['lock']:
+        connection = http_cache['connection']
+        row = connection.execute('SELECT headers, body FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is not None:
+            connection.execute('UPDATE responses SET used = ? WHERE url = ?', (time.time(), url))
+    if row is None:
+        return None
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = url
+    response.headers = requests.structures.CaseInsensitiveDict(json.loads(row[0]))
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.request = not_modified.request
+    response._content = bytes(row[1])
+    return response
+
+
+# cache response
+# Keeps a 200 response that has an ETag or a Last-Modified header and fits in the cache
+def cache_response(url, response):
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.status_code != 200 or not (etag or last_modified):
+        return
+    if 'no-store' in response.headers.get('Cache-Control', '').lower():
+        return
+    body = response.content
+    if len(body) > http_cache['max_bytes']:
+        return
+    headers = {name: value for name, value in response.headers.items() if name.lower() not in STORED_DROP_HEADERS}
+    with http_cache['lock']:
+        connection = http_cache['connection']
+        row = connection.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+        connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (url, etag, last_modified, json.dumps(headers), body, len(body), time.time()))
+        http_cache['size'] += len(body) - (row[0] if row else 0)
+        evict_http_cache()
+
+
+"""
+RUN METRICS
+"""
+
+# Run metrics
+# Time spent per stage (summed over the worker threads), counters and failures by stage and reason, reset by
+# main() at the start of every run
+run_metrics = {'stages': {}, 'counters': {}, 'failures': {}}
+run_metrics_lock = threading.Lock()
+
+
+# reset run metrics
+def reset_run_metrics():
+    with run_metrics_lock:
+        for values in run_metrics.values():
+            values.clear()
+
+
+# add stage time
+def add_stage_time(stage, seconds):
+    with run_metrics_lock:
+        entry = run_metrics['stages'].setdefault(stage, {'seconds': 0.0, 'calls': 0})
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+
+
+# count metric
+def count_metric(counter, amount=1):
+    with run_metrics_lock:
+        run_metrics['counters'][counter] = run_metrics['counters'].get(counter, 0) + amount
+
+
+# count failure
+# Counts a failure of stage ('fetch', 'parse', ...) by reason
+def count_failure(stage, reason):
+    with run_metrics_lock:
+        reasons = run_metrics['failures'].setdefault(stage, {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+
+# Run stage
+# Times the with block as one call of stage in the run metrics, and profiles it when profiling is on
+# The time is taken inside the profiling bracket, so the tracemalloc snapshots are not charged to the stage
+@contextmanager
+def run_stage(stage):
+    entry = start_stage_profile(stage) if profiling else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stage, time.perf_counter() - start)
+        if entry is not None:
+            stop_stage_profile(entry)
+
+
+# get run metrics
+# Returns a copy of the run metrics
+def get_run_metrics():
+    with run_metrics_lock:
+        return json.loads(json.dumps(run_metrics))
+
+
+# Metrics as JSON
+def metrics_json(metrics):
+    return json.dumps(metrics, indent=1, sort_keys=True)
+
+
+# prometheus label value
+def prometheus_label(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+# Metrics in the Prometheus text format
+# Every metric is a gauge prefixed with news_reuters_, stages, counters and failures become labels
+def metrics_prometheus(metrics):
+    lines = []
+
+    def add(name, help_text, samples):
+        lines.append('# HELP news_reuters_' + name + ' ' + help_text)
+        lines.append('# TYPE news_reuters_' + name + ' gauge')
+        for labels, value in samples:
+            label_text = ','.join(key + '=' + prometheus_label(label) for key, label in labels)
+            lines.append('news_reuters_' + name + ('{' + label_text + '}' if label_text else '') + ' ' +
+                         repr(float(value)))
+
+    add('run_seconds', 'Wall time of the run', [((), metrics.get('seconds', 0))])
+    add('stage_seconds', 'Time spent in each stage, summed over the worker threads',
+        [((('stage', stage),), entry['seconds']) for stage, entry in sorted(metrics['stages'].items())])
+    add('stage_calls', 'Number of times each stage ran',
+        [((('stage', stage),), entry['calls']) for stage, entry in sorted(metrics['stages'].items())])
+    add('articles', 'Article counters of the run',
+        [((('counter', counter),), value) for counter, value in sorted(metrics['counters'].items())])
+    add('failures', 'Failures by stage and reason',
+        [((('stage', stage), ('reason', reason)), value)
+         for stage, reasons in sorted(metrics['failures'].items()) for reason, value in sorted(reasons.items())])
+    add('http', 'HTTP counters of the run',
+        [((('counter', counter),), value) for counter, value in sorted(metrics.get('http', {}).items())])
+    add('pages_per_second', 'Article pages scraped per second', [((), metrics.get('pages_per_second') or 0)])
+    return '\n'.join(lines) + '\n'
+
+
+"""
+PROFILING
+"""
+
+# Profiling settings
+# While profiling is on (start_profiling()) every stage is run under its own cProfile profiler and tracemalloc
+# records allocations with PROFILE_TRACE_FRAMES frames. A thread only profiles its outermost stage, stages nested in
+# it show up in its profile. The stages of the worker threads are profiled per call and merged, on Pythons where
+# cProfile allows one profiler at a time these calls are only timed.
+# Memory is only measured for the stage calls of the main thread, the worker threads allocate at the same time.
+# The tracemalloc difference of a stage is taken over its first call, PROFILE_TOP_ALLOCATIONS lines are kept.
+# The collapsed stacks stop at calls shorter than PROFILE_MIN_SECONDS, their time is counted in the caller.
+PROFILE_TRACE_FRAMES = 10
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_MIN_SECONDS = 1e-4
+profiling = {}
+profile_thread_state = threading.local()
+
+
+# Start profiling
+# Turns profiling on, the reports are written to profile_dir by stop_profiling()
+# Returns False if profiling was already on
+def start_profiling(profile_dir):
+    if profiling:
+        return False
+    tracemalloc.start(PROFILE_TRACE_FRAMES)
+    profiling.update({'dir': profile_dir, 'lock': threading.Lock(), 'stats': {}, 'memory': {}, 'allocations': {}})
+    return True
+
+
+# start stage profile
+# Returns the profiling entry of one stage call, None if the thread is already profiling a stage
+def start_stage_profile(stage):
+    if getattr(profile_thread_state, 'active', False):
+        return None
+    profile_thread_state.active = True
+    main_thread = threading.current_thread() is threading.main_thread()
+    entry = {'stage': stage, 'main': main_thread, 'snapshot': None, 'profile': cProfile.Profile()}
+    with profiling['lock']:
+        first = main_thread and stage not in profiling['allocations']
+        if first:
+            profiling['allocations'][stage] = []
+    if first:
+        entry['snapshot'] = tracemalloc.take_snapshot()
+    if main_thread:
+        tracemalloc.reset_peak()
+        entry['memory'] = tracemalloc.get_traced_memory()[0]
+    try:
+        entry['profile'].enable()
+    except ValueError:
+        entry['profile'] = None
+    return entry
+
+
+# stop stage profile
+# Adds the profile and memory use of a stage call to the stage's totals
+def stop_stage_profile(entry):
+    if entry['profile'] is not None:
+        entry['profile'].disable()
+    if entry['main']:
+        current, peak = tracemalloc.get_traced_memory()
+    allocations = None
+    if entry['snapshot'] is not None:
+        allocations = tracemalloc.take_snapshot().compare_to(entry['snapshot'], 'traceback')[:PROFILE_TOP_ALLOCATIONS]
+    stage = entry['stage']
+    with profiling['lock']:
+        if entry['profile'] is not None:
+            if stage in profiling['stats']:
+                profiling['stats'][stage].add(entry['profile'])
+            else:
+                profiling['stats'][stage] = pstats.Stats(entry['profile'])
+        if entry['main']:
+            memory = profiling['memory'].setdefault(stage, {'calls': 0, 'net_bytes': 0, 'peak_bytes': 0})
+            memory['calls'] += 1
+            memory['net_bytes'] += current - entry['memory']
+            memory['peak_bytes'] = max(memory['peak_bytes'], peak - entry['memory'])
+        if allocations is not None:
+            profiling['allocations'][stage] = allocations
+    profile_thread_state.active = False
+
+
+# profile function label
+def profile_label(function):
+    file_name, line, name = function
+    label = name if file_name == '~' else name + ' (' + os.path.basename(file_name) + ':' + str(line) + ')'
+    return label.replace(';', ',')
+
+
+# Collapsed stacks
+# Rebuilds call stacks from a pstats caller graph: a function's inclusive time is split over its callers in
+# proportion to the time spent in each call edge, self time becomes the value of the stack ending in it
+# Returns the lines 'root;caller;function microseconds' of flamegraph.pl's collapsed format
+def collapsed_stacks(stats, min_seconds=PROFILE_MIN_SECONDS, max_depth=64):
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+    totals = {}
+
+    def walk(function, path, share):
+        path = path + [profile_label(function)]
+        value = stats.stats[function][2] * share
+        for callee, edge_time in callees.get(function, []):
+            callee_total = stats.stats[callee][3]
+            if callee_total <= 0 or profile_label(callee) in path:
+                continue
+            if edge_time * share < min_seconds or len(path) >= max_depth:
+                value += edge_time * share
+            else:
+                walk(callee, path, edge_time * share / callee_total)
+        key = ';'.join(path)
+        totals[key] = totals.get(key, 0) + value
+
+    for function, (_, _, _, total_time, callers) in stats.stats.items():
+        if not callers and total_time > 0:
+            walk(function, [], 1.0)
+    return [key + ' ' + str(int(round(value * 1e6))) for key, value in sorted(totals.items())
+            if round(value * 1e6) > 0]
+
+
+# Stop profiling
+# Turns profiling off and writes the reports to the profiling directory: <stage>.prof, <stage>.collapsed and
+# <stage>.allocations.txt per stage and memory.json with the net and peak traced memory of the stages run in the
+# main thread
+# Returns the memory summary, None if profiling was off
+def stop_profiling():
+    if not profiling:
+        return None
+    profile_dir = profiling['dir']
+    os.makedirs(profile_dir, exist_ok=True)
+    for stage, stats in profiling['stats'].items():
+        stats.dump_stats(os.path.join(profile_dir, stage + '.prof'))
+        with open(os.path.join(profile_dir, stage + '.collapsed'), 'w', encoding='utf-8') as out_file:
+            out_file.writelines(line + '\n' for line in collapsed_stacks(stats))
+    for stage, allocations in profiling['allocations'].items():
+        with open(os.path.join(profile_dir, stage + '.allocations.txt'), 'w', encoding='utf-8') as out_file:
+            for allocation in allocations:
+                out_file.write(str(allocation) + '\n')
+                out_file.writelines('    ' + line + '\n' for line in allocation.traceback.format())
+    memory = profiling['memory']
+    stages = set(profiling['stats']) | set(memory)
+    with open(os.path.join(profile_dir, 'memory.json'), 'w', encoding='utf-8') as out_file:
+        json.dump(memory, out_file, indent=1, sort_keys=True)
+    tracemalloc.stop()
+    profiling.clear()
+    print('Profiles of', len(stages), 'stages written to', profile_dir)
+    return memory
+
+
+# Save metrics
+# Writes metrics in the Prometheus text format if path ends with .prom and as JSON otherwise
+def save_metrics(metrics, path):
+    text = metrics_prometheus(metrics) if path.endswith('.prom') else metrics_json(metrics) + '\n'
+    path = os.path.abspath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as out_file:
+        out_file.write(text)
+    os.replace(tmp_path, path)
+
+
 """
 GET LINKS FROM HTML
 """
 
 
-# get HTML with page scroll
-# Function updated to allow user to define the browser agent
-# Browser flag allows the user to define the type of browser used by selenium
-# Code supports Firefox and Chrome, default is Chrome if no browser agent is specified
-def get_html_scroll(url, browser_agent="Firefox"):
-    # calls the webdriver based on the user's selection
+# Listing page settings
+# LISTING_LINK_SELECTOR is the CSS selector of the article links the listing page is waited on
+# The page counts as loaded once at least one link is present and the number of links has not changed for
+# LISTING_SETTLE seconds, the count is polled every LISTING_POLL seconds, for at most LISTING_MAX_WAIT seconds
+LISTING_LINK_SELECTOR = "a[href*='/article/']"
+LISTING_SETTLE = 1.0
+LISTING_POLL = 0.25
+LISTING_MAX_WAIT = 30
+
+# Lean browser profile
+# Requests matching BLOCKED_URL_PATTERNS (images, fonts, stylesheets) or going to AD_HOSTS are never downloaded
+BLOCKED_URL_PATTERNS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.css',
+                        '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+AD_HOSTS = ['doubleclick.net', 'googlesyndication.com', 'googletagservices.com', 'googletagmanager.com',
+            'google-analytics.com', 'adsafeprotected.com', 'amazon-adsystem.com', 'moatads.com',
+            'scorecardresearch.com', 'krxd.net', 'chartbeat.com', 'outbrain.com', 'taboola.com']
+
+
+# get browser
+# Starts the webdriver for the requested browser agent
+# With lean=True images, fonts, stylesheets and ads are blocked to cut page load time and browser memory
+# Chrome blocks them through the DevTools protocol, Firefox through profile preferences and a proxy
+# auto-config script that sends ad hosts to an unreachable proxy
+def get_browser(browser_agent="Firefox", lean=True):
+    import selenium.webdriver as webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.common.exceptions import WebDriverException
     if browser_agent == "Firefox":
-        browser = webdriver.Firefox()
+        profile = webdriver.FirefoxProfile()
+        if lean:
+            profile.set_preference('permissions.default.image', 2)
+            profile.set_preference('permissions.default.stylesheet', 2)
+            profile.set_preference('browser.display.use_document_fonts', 0)
+            profile.set_preference('media.autoplay.default', 5)
+            ad_check = ' || '.join('dnsDomainIs(h, "' + host + '")' for host in AD_HOSTS)
+            profile.set_preference('network.proxy.type', 2)
+            profile.set_preference('network.proxy.autoconfig_url',
+                                   'data:text/plain,function FindProxyForURL(u, h) { if (' + ad_check +
+                                   ') return "PROXY 127.0.0.1:9"; return "DIRECT"; }')
+        browser = webdriver.Firefox(firefox_profile=profile)
     elif browser_agent == "Chrome":
         chrome_options = Options() # Using Options() to fix deprecation warning of manual options declarations
         chrome_options.add_argument('--headless')
         chrome_options.add_argument('--no-sandbox')
         chrome_options.add_argument('--disable-dev-shm-usage')
-        browser = webdriver.Chrome('chromedriver', options=chrome_options) # Using 'options=' to fix deprecation warning
+        if lean:
+            chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+            chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        browser = webdriver.Chrome(chromedriver_path, options=chrome_options) # Using 'options=' to fix deprecation warning
+        if lean:
+            blocked = BLOCKED_URL_PATTERNS + ['*' + host + '*' for host in AD_HOSTS]
+            try:
+                browser.execute_cdp_cmd('Network.enable', {})
+                browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked})
+            except WebDriverException:
+                print('NOTICE: Chrome driver does not support request blocking, loading full pages')
     # else:
     # else section intentionally empty and reserved for future use
     # the else section is not needed in this code as get_html_scroll() is designed to be called by main()
     # and the main() process checks the browser_agent prior to passing to get_html_scroll()
+    return browser
+
+
+# wait for links
+# Returns a WebDriverWait condition that scrolls to the bottom of the page (so lazy content still loads)
+# and is met once the number of links matching selector is non-zero and unchanged for settle seconds
+def links_settled(selector, settle):
+    state = {'count': -1, 'since': time.monotonic()}
+    script = ("window.scrollTo(0, document.body.scrollHeight);" +
+              "return document.querySelectorAll(arguments[0]).length;")
+
+    def condition(browser):
+        count = browser.execute_script(script, selector)
+        now = time.monotonic()
+        if count != state['count']:
+            state['count'] = count
+            state['since'] = now
+            return False
+        return count > 0 and now - state['since'] >= settle
+    return condition
+
+
+"""
+BROWSER POOL
+"""
+
+# Idle browsers are kept per (browser_agent, lean) key, at most BROWSER_POOL_SIZE of each
+BROWSER_POOL_SIZE = 2
+browser_pool = {}
+browser_pool_lock = threading.Lock()
+
+
+# check browser
+# A browser is healthy if its driver still answers a trivial script
+def browser_alive(browser):
+    try:
+        return browser.execute_script('return 1;') == 1
+    except Exception:
+        return False
+
+
+# quit browser
+# Ignores errors from browsers whose driver has already gone away
+def quit_browser(browser):
+    try:
+        browser.quit()
+    except Exception:
+        pass
+
+
+# acquire browser
+# Returns a healthy idle browser from the pool, starting a new one if there is none
+def acquire_browser(browser_agent="Firefox", lean=True):
+    key = (browser_agent, lean)
+    while True:
+        with browser_pool_lock:
+            idle = browser_pool.get(key)
+            browser = idle.pop() if idle else None
+        if browser is None:
+            return get_browser(browser_agent, lean)
+        if browser_alive(browser):
+            return browser
+        quit_browser(browser)
+
+
+# release browser
+# Puts the browser back in the pool, or quits it if the pool is already full
+def release_browser(browser, browser_agent="Firefox", lean=True):
+    key = (browser_agent, lean)
+    with browser_pool_lock:
+        idle = browser_pool.setdefault(key, [])
+        if len(idle) < BROWSER_POOL_SIZE:
+            idle.append(browser)
+            return
+    quit_browser(browser)
 
-    browser.get(url)
-    lenOfPage = browser.execute_script("window.scrollTo(0, document.body.scrollHeight);" +
-                                       "var lenOfPage=document.body.scrollHeight;" +
-                                       "return lenOfPage;")
-    match = False
-    while (match == False):
-        lastCount = lenOfPage
-        time.sleep(4)
-        lenOfPage = browser.execute_script("window.scrollTo(0, document.body.scrollHeight);" +
-                                           "var lenOfPage=document.body.scrollHeight;" +
-                                           "return lenOfPage;")
-        if lastCount == lenOfPage:
-            time.sleep(4)
-            match = True
-    post_elms = browser.page_source
+
+# close browsers
+# Quits every pooled browser, called by cleanup() and at interpreter exit
+def close_browsers():
+    with browser_pool_lock:
+        browsers = [browser for idle in browser_pool.values() for browser in idle]
+        browser_pool.clear()
+    for browser in browsers:
+        quit_browser(browser)
+
+
+atexit.register(close_browsers)
+
+
+# get HTML with page scroll
+# Function updated to allow user to define the browser agent
+# Browser flag allows the user to define the type of browser used by selenium
+# Code supports Firefox and Chrome, default is Chrome if no browser agent is specified
+# Updated to replace the fixed time.sleep(4) polling with links_settled(), the page is returned as soon as the
+# article links have loaded or after max_wait seconds, whichever comes first
+# Updated to borrow the browser from the pool, a browser that fails is quit instead of returned to the pool
+def get_html_scroll(url, browser_agent="Firefox", max_wait=LISTING_MAX_WAIT, lean=True):
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    browser = acquire_browser(browser_agent, lean)
+    try:
+        browser.get(url)
+        try:
+            WebDriverWait(browser, max_wait, poll_frequency=LISTING_POLL).until(
+                links_settled(LISTING_LINK_SELECTOR, LISTING_SETTLE))
+        except TimeoutException:
+            print('NOTICE: listing page did not settle within', max_wait, 'seconds, using the page as loaded')
+        post_elms = browser.page_source
+    except BaseException:
+        # includes KeyboardInterrupt, a browser that is neither pooled nor quit would outlive the process
+        quit_browser(browser)
+        raise
+    release_browser(browser, browser_agent, lean)
     return post_elms
 
 
 # get HTML file
+# Updated to download through the shared session in fetch()
+# Updated to add the download and parse times to the run metrics
+# Updated to keep the page in the page archive when one is open (see open_page_archive())
+# Updated to return (None, None) for a page that did not come back with a 200 status, counted as a fetch failure
 def get_html(url):
-    page = requests.get(url)
-    html_out = html.fromstring(page.content)
-    text = page.text
+    with run_stage('fetch'):
+        page = fetch(url)
+    if page.status_code != 200:
+        print('Unable to fetch', url, '(HTTP', str(page.status_code) + ')')
+        count_failure('fetch', 'HTTP ' + str(page.status_code))
+        return None, None
+    if page_archive:
+        with run_stage('archive'):
+            archive_page(url, page)
+    with run_stage('parse'):
+        html_out = html.fromstring(page.content)
+        text = page.text
     return html_out, text
 
 
@@ -159,33 +1005,105 @@ def get_soup_links(soup):
 REUTERS FUNCTIONS
 """
 
+# Reuters URLs
+# theWire is paginated, REUTERS_LISTING_PAGE_URL is formatted with the page number (starting at 1)
+REUTERS_URL = 'https://www.reuters.com'
+REUTERS_LISTING_URL = REUTERS_URL + '/theWire'
+REUTERS_LISTING_PAGE_URL = REUTERS_LISTING_URL + '?view=page&page={page}&pageSize=10'
+LISTING_PAGES = 5
+
 
 # get article links
 # This function stopped working on 19 May 2020 when Reuters updated their https://www.reuters.com/theWire page
 # The https://www.reuters.com/theWire page updated to change from a infinite scroll to paginated
 # Additionally, the updated webpage uses relative not absolute links
 # Fixed code by prepending https://www.reuters.com to link if it is missing
-def get_articles_reuters(links, old_url_set):
+# Updated to confirm the links against a UrlIndex in one pass over the URL index (see UrlIndex.confirm())
+def get_articles_reuters(links, old_url_set, base_url=REUTERS_URL):
     articles = []
+    if isinstance(old_url_set, UrlIndex):
+        old_url_set.confirm([link if base_url in link else base_url + link
+                             for link in links if isinstance(link, str) and '/article/' in link])
     for link in links:
         try:
              if '/article/' in link:
-                if 'https://www.reuters.com' not in link: 
-                    link = 'https://www.reuters.com' + link
+                if base_url not in link: 
+                    link = base_url + link
                 if not url_check(old_url_set, link):
                     articles.append(link)
+                else:
+                    count_metric('known_urls')
         except:
             continue
     return articles
 
 
+# Per-host download limits
+# One semaphore per host name and limit, created on first use and shared by every worker thread
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
+
+
+def get_host_semaphore(url, max_per_host):
+    key = (urlparse(url).netloc, max_per_host)
+    with host_semaphores_lock:
+        if key not in host_semaphores:
+            host_semaphores[key] = threading.BoundedSemaphore(max_per_host)
+        semaphore = host_semaphores[key]
+    return semaphore
+
+
+# get article soup
+# Downloads and parses a single article while holding its host's semaphore
+# Returns None if the article could not be downloaded, get_reuters_elements() will skip it
+def get_article_soup(article, max_per_host):
+    try:
+        with get_host_semaphore(article, max_per_host):
+            _, text = get_html(article)
+    except requests.RequestException as error:
+        print('Unable to fetch', article, '(' + type(error).__name__ + ')')
+        count_failure('fetch', type(error).__name__)
+        return None
+    if text is None:
+        return None
+    soup = get_soup(text)
+    return soup
+
+
+# iterate article html
+# Yields (article, soup) pairs in the order of articles while downloading up to max_workers at once
+# No more than window articles (default 2 * max_workers) are in flight or waiting to be consumed, so memory
+# stays constant however many articles there are
+# loader turns an article link into its parsed page, get_article_tree yields lxml trees instead of soups
+def iter_html_reuters(articles, max_workers=8, max_per_host=4, window=None, loader=get_article_soup):
+    if max_workers <= 1:
+        for article in articles:
+            yield article, loader(article, max_per_host)
+        return
+    window = window or 2 * max_workers
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from iter_ordered(executor, partial(loader, max_per_host=max_per_host), articles, window)
+
+
+# get article tree
+# Downloads a single article like get_article_soup() but keeps the lxml tree parsed by get_html()
+def get_article_tree(article, max_per_host):
+    try:
+        with get_host_semaphore(article, max_per_host):
+            html_out, _ = get_html(article)
+    except (requests.RequestException, etree.ParserError) as error:
+        print('Unable to fetch', article, '(' + type(error).__name__ + ')')
+        count_failure('fetch', type(error).__name__)
+        return None
+    return html_out
+
+
 # get article html
-def get_html_reuters(articles):
-    soup_list = []
-    for article in articles:
-        _, text = get_html(article)
-        soup = get_soup(text)
-        soup_list.append(soup)
+# Updated to download the articles concurrently with a bounded thread pool
+# max_workers is the global concurrency, max_per_host caps concurrent requests to a single host
+# soup_list lines up with articles
+def get_html_reuters(articles, max_workers=8, max_per_host=4):
+    soup_list = [soup for _, soup in iter_html_reuters(articles, max_workers, max_per_host, window=len(articles))]
     return soup_list
 
 
@@ -202,85 +1120,400 @@ def format_date(date):
     return out_date
 
 
+"""
+EXTRACTION FUNCTIONS
+"""
+
+
+# class XPath
+# Matches tag elements that have class_name as one of their classes, like BeautifulSoup's class_ matching
+def class_xpath(tag, class_name):
+    return "//" + tag + "[contains(concat(' ', normalize-space(@class), ' '), ' " + class_name + " ')]"
+
+
+# Extraction rules
+# Keyed by source, each rule set gives the XPath of the headline element, the date element and the body paragraphs
+EXTRACTION_RULES = {
+    'www.reuters.com': {
+        'headline': class_xpath('h1', 'ArticleHeader_headline'),
+        'date': class_xpath('div', 'ArticleHeader_date'),
+        'body': class_xpath('div', 'StandardArticleBody_body') + '//p',
+    },
+}
+compiled_rules = {}
+
+
+# get compiled rules
+# Compiles a source's rules to etree.XPath objects once and reuses them for every article
+# The compiled rules are keyed by the rule values, so rules changed in place are compiled again
+def get_rules(source):
+    key = tuple(sorted(EXTRACTION_RULES[source].items()))
+    rules = compiled_rules.get(source)
+    if rules is None or rules[0] != key:
+        rules = (key, {field: etree.XPath(path) for field, path in key})
+        compiled_rules[source] = rules
+    return rules[1]
+
+
+# split date and time
+# Reuters dates look like 'May 19, 2020 /  6:18 PM / Updated ...', anything else is kept as is in both fields
+def split_date_time(date_text):
+    try:
+        date_time = date_text.split(' / ')
+        date = format_date(date_time[0])
+        a_time = date_time[1][1:]
+    except (IndexError, KeyError):
+        date = date_text
+        a_time = date_text
+    return date, a_time
+
+
+# extract article
+# Single pass replacement for get_soup() + get_reuters_element(), tree is the lxml tree from get_html()
+# Returns the article record, or None if the article cannot be decoded
+# Updated to count failures by the field that could not be decoded
+def extract_article(tree, link, source='www.reuters.com'):
+    field = 'rules'
+    try:
+        rules = get_rules(source)
+        field = 'headline'
+        headline = rules['headline'](tree)[0].text_content()
+        field = 'date'
+        date, a_time = split_date_time(rules['date'](tree)[0].text_content())
+        field = 'body'
+        out_text = ' '.join(p.text_content() for p in rules['body'](tree))
+    except (IndexError, TypeError, AttributeError, KeyError) as error:
+        reason = parse_failure_reason(field, error)
+        print('Unable to decode...skipping article...', '(' + reason + ')')
+        count_failure('parse', reason)
+        return None
+    out_dict = dict([('date', date), ('time', a_time), ('source', source), ('Title', headline),
+                     ('Text', out_text), ('url', link)])
+    return out_dict
+
+
+# parse failure reason
+# A missing element is reported as 'missing <field>', anything else as '<field> <exception name>'
+def parse_failure_reason(field, error):
+    if isinstance(error, IndexError):
+        return 'missing ' + field
+    return field + ' ' + type(error).__name__
+
+
+# get element
+# Extracts the record of a single article, returns None if the article cannot be decoded
+# BeautifulSoup version of extract_article(), kept for soups from get_html_reuters()
+# Updated to count failures by the field that could not be decoded
+def get_reuters_element(article, link):
+    field = 'page'
+    try:
+        article_body = article.find_all('div', {'class': 'StandardArticleBody_body'})
+        article_headline = article.find_all('h1', {'class': 'ArticleHeader_headline'})
+        article_date = article.find_all('div', {'class': 'ArticleHeader_date'})
+        try:
+            date_time = article_date[0].text.split(' / ')
+            date_in = date_time[0]
+            date = format_date(date_in)
+            a_time = date_time[1][1:]
+        except:
+            field = 'date'
+            date = article_date[0].text
+            a_time = article_date[0].text
+        field = 'headline'
+        headline = article_headline[0].text
+        field = 'body'
+        article_p = []
+        for item in article_body:
+            p_list = item.find_all('p')
+            for p in p_list:
+                article_p.append(p.text)
+        out_text = ' '.join(article_p)
+        out_dict = dict([('date', date), ('time', a_time), ('source', 'www.reuters.com'), ('Title', headline),
+                         ('Text', out_text), ('url', link)])
+    except Exception as error:
+        reason = parse_failure_reason(field, error)
+        print('Unable to decode...skipping article...', '(' + reason + ')')
+        count_failure('parse', reason)
+        return None
+    return out_dict
+
+
 # get elements
 def get_reuters_elements(soup_list, articles):
     out_list = []
-    i = 0
-    for article in soup_list:
-        link = articles[i]
-        i += 1
-        try:
-            article_body = article.find_all('div', {'class': 'StandardArticleBody_body'})
-            article_headline = article.find_all('h1', {'class': 'ArticleHeader_headline'})
-            article_date = article.find_all('div', {'class': 'ArticleHeader_date'})
-            try:
-                date_time = article_date[0].text.split(' / ')
-                date_in = date_time[0]
-                date = format_date(date_in)
-                a_time = date_time[1][1:]
-            except:
-                date = article_date[0].text
-                time = article_date[0].text
-            headline = article_headline[0].text
-            article_p = []
-            for item in article_body:
-                p_list = item.find_all('p')
-                for p in p_list:
-                    article_p.append(p.text)
-            out_text = ' '.join(article_p)
-            out_dict = dict([('date', date), ('time', a_time), ('source', 'www.reuters.com'), ('Title', headline),
-                             ('Text', out_text), ('url', link)])
+    for article, link in zip(soup_list, articles):
+        out_dict = get_reuters_element(article, link)
+        if out_dict is not None:
             out_list.append(out_dict)
-        except:
-            print('Unable to decode...skipping article...')
-            continue
     return out_list
 
 
-# Execute Reuters script
-def reuters(old_url_set, browser_agent):
+# get listing page
+# Returns the HTML text of one listing page, or None if it could not be downloaded
+def get_listing_page(url):
+    try:
+        page = fetch(url)
+    except requests.RequestException as error:
+        print('Unable to fetch listing page', url, '(' + type(error).__name__ + ')')
+        return None
+    if page.status_code != 200:
+        print('Unable to fetch listing page', url, '(HTTP', str(page.status_code) + ')')
+        return None
+    return page.text
+
+
+# get listing links over HTTP
+# Downloads listing pages 1..pages concurrently and returns their links in page order without duplicates
+def get_listing_links_http(page_url=REUTERS_LISTING_PAGE_URL, pages=LISTING_PAGES, max_workers=8):
+    urls = [page_url.format(page=page) for page in range(1, pages + 1)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, pages))) as executor:
+        listing_pages = list(executor.map(get_listing_page, urls))
+    links = []
+    for listing_page in listing_pages:
+        if listing_page is not None:
+            links.extend(get_soup_links(get_soup(listing_page)))
+    links = list(dict.fromkeys(links))
+    return links
+
+
+# get listing links with a browser
+# Original selenium listing, Chrome needs check_chrome() to provide the driver first
+# Reads listing pages 1..pages with the same pooled browser and returns their links without duplicates
+# max_wait and lean are passed on to get_html_scroll()
+def get_listing_links_browser(browser_agent, pages=1, max_wait=LISTING_MAX_WAIT, lean=True):
+    if browser_agent == "Chrome":
+        check_chrome()
+    urls = [REUTERS_LISTING_URL] + [REUTERS_LISTING_PAGE_URL.format(page=page) for page in range(2, pages + 1)]
+    links = []
+    for url in urls:
+        post_elms = get_html_scroll(url, browser_agent, max_wait, lean)
+        soup = get_soup(post_elms)
+        links.extend(get_soup_links(soup))
+    links = list(dict.fromkeys(links))
+    return links
+
+
+# get new article links
+# listing='http' reads the listing pages without a browser and falls back to the browser when they contain no
+# article links (e.g. the page is rendered client side), listing='browser' always uses the browser
+# listing_wait and lean_browser set the browser's maximum wait per page and lean mode (see get_html_scroll())
+def get_new_articles(old_url_set, browser_agent, max_workers=8, listing='http', listing_pages=LISTING_PAGES,
+                     listing_wait=LISTING_MAX_WAIT, lean_browser=True):
+    with run_stage('listing'):
+        links = []
+        if listing == 'http':
+            links = get_listing_links_http(pages=listing_pages, max_workers=max_workers)
+            if not any(link and '/article/' in link for link in links):
+                print('NOTICE: no article links found in the HTTP listing, falling back to', browser_agent,
+                      'webdriver')
+                links = []
+        if not links:
+            links = get_listing_links_browser(browser_agent, listing_pages, listing_wait, lean_browser)
+    with run_stage('filter'):
+        articles = get_articles_reuters(links, old_url_set)
+    count_metric('links', len(links))
+    count_metric('new_urls', len(articles))
+    return articles
+
+
+# Stream Reuters articles
+# Yields the record of each new article as soon as it has been downloaded and extracted
+def iter_reuters(old_url_set, browser_agent, max_workers=8, max_per_host=4, listing='http',
+                 listing_pages=LISTING_PAGES, window=None, listing_wait=LISTING_MAX_WAIT, lean_browser=True):
     print('Getting Reuters articles...')
-    url = 'https://www.reuters.com/theWire'
-    post_elms = get_html_scroll(url, browser_agent)
-    soup = get_soup(post_elms)
-    links = get_soup_links(soup)
-    articles = get_articles_reuters(links, old_url_set)
-    soup_list = get_html_reuters(articles)
-    reuters_list = get_reuters_elements(soup_list, articles)
+    articles = get_new_articles(old_url_set, browser_agent, max_workers, listing, listing_pages, listing_wait,
+                                lean_browser)
+    for article, tree in iter_html_reuters(articles, max_workers, max_per_host, window, loader=get_article_tree):
+        with run_stage('extract'):
+            out_dict = extract_article(tree, article) if tree is not None else None
+        del tree
+        if out_dict is not None:
+            yield out_dict
+
+
+# Execute Reuters script
+def reuters(old_url_set, browser_agent, max_workers=8, max_per_host=4, listing='http', listing_pages=LISTING_PAGES,
+            listing_wait=LISTING_MAX_WAIT, lean_browser=True):
+    reuters_list = list(iter_reuters(old_url_set, browser_agent, max_workers, max_per_host, listing, listing_pages,
+                                     listing_wait=listing_wait, lean_browser=lean_browser))
     return reuters_list
 
 
-# Get Chrome
-# Adds local support for chrome driver if not found. function in OS aware, and fetches the appropriate version of
-# chrome driver for the OS, extracts the zip, places the executable in the current working directory. This is the
-# first checked PATH option for execution flow, then /bin, then /sbin, etc. Local placement allows for simpler
-# environment set-up, and removes the requirement to force a non standard PATH variable into sys.
-def check_chrome():
+# Chrome driver settings
+# Drivers are cached under <cache dir>/chromedriver/<os>-<arch>/<version>/ and reused by every later run
+# The cache dir is $NEWS_REUTERS_CACHE, or the user cache directory of the platform
+# A download is checked against the MD5 digest the storage server sends in its x-goog-hash header and rejected if
+# it does not match or the header is missing. The SHA-256 of a checked download is kept next to it (<archive>.sha256).
+# CHROMEDRIVER_SHA256 pins SHA-256 digests of driver archives keyed by (version, archive name), sha256= pins one for
+# a single call. An archive that does not match its pinned or recorded digest is rejected.
+# An archive placed in <cache dir>/chromedriver/archives/<version>/ (or passed as archive=) is installed without
+# touching the network, it is installed unverified (with a notice) when there is no digest to check it against
+CHROMEDRIVER_VERSION = '83.0.4103.39'
+CHROMEDRIVER_URL = 'https://chromedriver.storage.googleapis.com/{version}/{archive}'
+CHROMEDRIVER_SHA256 = {}
+chromedriver_path = 'chromedriver'
+
+
+# get cache directory
+def get_cache_dir():
+    cache_dir = os.environ.get('NEWS_REUTERS_CACHE')
+    if cache_dir:
+        return cache_dir
     os_platform = platform.system()
+    if os_platform == 'Windows':
+        base_dir = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif os_platform == 'Darwin':
+        base_dir = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+    else:
+        base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'news_reuters')
+
+
+# get chrome driver archive name
+# chromedriver only publishes one 64 bit build for Linux and Mac and a 32 bit build for Windows
+def chromedriver_archive_name(os_platform):
+    if os_platform == 'Windows':
+        return 'chromedriver_win32.zip'
+    elif os_platform == 'Darwin':
+        return 'chromedriver_mac64.zip'
+    return 'chromedriver_linux64.zip'
+
 
+# file checksum
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# server MD5
+# Returns the MD5 digest given in an x-goog-hash header ('crc32c=...,md5=...', base64 values), None if there is none
+def goog_hash_md5(header):
+    for part in (header or '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name == 'md5' and value:
+            try:
+                return base64.b64decode(value)
+            except ValueError:
+                return None
+    return None
+
+
+# get chrome driver archive
+# Returns the path of the driver archive, using archive if given, then a pre-seeded archive in the cache, and only
+# then downloading it. Downloads are written to a temporary file and renamed so a partial file is never used.
+# Updated to check downloads against the server's MD5 and record their SHA-256 next to them
+def get_chromedriver_archive(version, archive_name, archive_dir, archive=None):
+    if archive:
+        return archive
+    archive_path = os.path.join(archive_dir, archive_name)
+    if os.path.isfile(archive_path):
+        return archive_path
+    print("Chrome Driver", version, "not cached...downloading...")
+    os.makedirs(archive_dir, exist_ok=True)
+    dl_file = fetch(CHROMEDRIVER_URL.format(version=version, archive=archive_name))
+    dl_file.raise_for_status()
+    server_md5 = goog_hash_md5(dl_file.headers.get('x-goog-hash'))
+    if server_md5 is None or hashlib.md5(dl_file.content).digest() != server_md5:
+        raise ValueError('Chrome driver download ' + archive_name + ' failed checksum verification' +
+                         (' (no MD5 from the server)' if server_md5 is None else ''))
+    write_store_file(archive_path + '.sha256', [hashlib.sha256(dl_file.content).hexdigest()])
+    fd, tmp_path = tempfile.mkstemp(dir=archive_dir, suffix='.part')
+    with os.fdopen(fd, 'wb') as out_file:
+        out_file.write(dl_file.content)
+    os.replace(tmp_path, archive_path)
+    return archive_path
+
+
+# recorded archive digest
+# Returns the SHA-256 recorded when archive_path was downloaded, None if there is none
+def recorded_sha256(archive_path):
     try:
-        if os_platform == 'Windows':
-            open('chromedriver.exe')
-        else:
-            open('chromedriver')
-    except Exception:
-        dl_url = ''
-        print("Chrome Driver not found...installing locally...")
+        with open(archive_path + '.sha256', 'r', encoding='utf-8') as in_file:
+            return in_file.read().strip() or None
+    except OSError:
+        return None
 
-        if os_platform == 'Windows':
-            dl_url = 'https://chromedriver.storage.googleapis.com/81.0.4044.138/chromedriver_win32.zip'
-        else:
-            dl_url = 'https://chromedriver.storage.googleapis.com/81.0.4044.138/chromedriver_linux64.zip'
-
-        with urllib.request.urlopen(dl_url) as dl_file:
-            with open('chromedriver.zip', 'wb') as out_file:
-                out_file.write(dl_file.read())
-                out_file.close()
-        with zipfile.ZipFile('chromedriver.zip', 'r') as zip_file:
-            zip_file.extractall()
-            zip_file.close()
-        os.remove('chromedriver.zip')
-        pass
+
+# install chrome driver
+# Extracts the driver into a temporary directory next to driver_dir and renames it into place, so a crashed or
+# concurrent install never leaves a half written driver in the cache. The driver's checksum is written to a
+# manifest next to it and checked every time the cached driver is reused.
+def install_chromedriver(archive_path, driver_dir, driver_name):
+    parent_dir = os.path.dirname(driver_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.install-')
+    try:
+        with zipfile.ZipFile(archive_path, 'r') as zip_file:
+            if zip_file.testzip() is not None:
+                raise zipfile.BadZipFile('corrupt chrome driver archive ' + archive_path)
+            zip_file.extract(driver_name, tmp_dir)
+        driver = os.path.join(tmp_dir, driver_name)
+        os.chmod(driver, 0o755)
+        with open(os.path.join(tmp_dir, driver_name + '.sha256'), 'w') as manifest:
+            manifest.write(file_sha256(driver))
+        try:
+            os.replace(tmp_dir, driver_dir)
+        except OSError:
+            # another process installed the same version first
+            if not os.path.isdir(driver_dir):
+                raise
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# cached chrome driver
+# Returns True if the driver in driver_dir exists and matches its manifest checksum
+def chromedriver_cached(driver_dir, driver_name):
+    driver = os.path.join(driver_dir, driver_name)
+    try:
+        with open(driver + '.sha256') as manifest:
+            expected = manifest.read().strip()
+    except OSError:
+        return False
+    return os.path.isfile(driver) and file_sha256(driver) == expected
+
+
+# Get Chrome
+# Adds local support for chrome driver if not found. function in OS aware, and fetches the appropriate version of
+# chrome driver for the OS
+# Updated to keep the driver in a versioned cache instead of downloading it to the current working directory on every
+# run. A chromedriver already present in the current working directory is still used as is.
+# Returns the path of the driver, which is also used by get_browser()
+def check_chrome(version=CHROMEDRIVER_VERSION, archive=None, sha256=None):
+    global chromedriver_path
+    os_platform = platform.system()
+    driver_name = 'chromedriver.exe' if os_platform == 'Windows' else 'chromedriver'
+    if os.path.isfile(driver_name):
+        chromedriver_path = os.path.abspath(driver_name)
+        return chromedriver_path
+
+    cache_dir = os.path.join(get_cache_dir(), 'chromedriver')
+    os_arch = os_platform.lower() + '-' + (platform.machine().lower() or 'unknown')
+    driver_dir = os.path.join(cache_dir, os_arch, version)
+    if not chromedriver_cached(driver_dir, driver_name):
+        if os.path.isdir(driver_dir):
+            shutil.rmtree(driver_dir, ignore_errors=True)
+        archive_name = chromedriver_archive_name(os_platform)
+        archive = archive or os.environ.get('NEWS_REUTERS_CHROMEDRIVER_ARCHIVE')
+        archive_path = get_chromedriver_archive(version, archive_name, os.path.join(cache_dir, 'archives', version),
+                                                archive)
+        expected = sha256 or CHROMEDRIVER_SHA256.get((version, archive_name)) or recorded_sha256(archive_path)
+        digest = file_sha256(archive_path)
+        if expected and digest != expected.lower():
+            if not archive:
+                os.remove(archive_path)
+            raise ValueError('Chrome driver archive ' + archive_path + ' failed checksum verification')
+        if not expected:
+            print('NOTICE: no checksum known for', archive_path, '...installing it unverified, pass sha256= to '
+                  'verify it')
+        print("Installing Chrome Driver", version, "(sha256 " + digest + ")...")
+        install_chromedriver(archive_path, driver_dir, driver_name)
+    chromedriver_path = os.path.join(driver_dir, driver_name)
+    return chromedriver_path
 
 # Useless but fun
 def banner():
@@ -289,128 +1522,1744 @@ def banner():
 
 # Cleanup of temporary file
 # Updated to use os.path.isfile() method to check if file exists
-def cleanup():
-    if os.path.isfile('chromedriver.exe'):
-        os.remove('chromedriver.exe')
-    elif os.path.isfile('chromedriver'):
-        os.remove('chromedriver')
-    elif os.path.isfile('geckodriver.log'):
-        os.remove('geckodriver.log')
+# Updated to shut down the pooled browsers, keep_browsers=True leaves them in place so the next main() call in the
+# same process can reuse them
+# The chrome driver is no longer removed, it lives in the driver cache (see check_chrome()) and is reused next run
+# The geckodriver log is removed either way, a log still held open by a kept browser (Windows) is left in place
+def cleanup(keep_browsers=False):
+    if not keep_browsers:
+        close_browsers()
+    if os.path.isfile('geckodriver.log'):
+        try:
+            os.remove('geckodriver.log')
+        except OSError:
+            pass
     return
 
 
-"""
-MAIN SCRIPT
-Updated function to allow user to specify a browser agent and news_dump_object filename
-If not specified the code will default to a browser agent of "Chrome" and filename of "news_dump_object.json"
+# records dataframe
+# Builds a news dataframe from article records with the date column as a pandas date-time
+def records_df(records):
+    import pandas as pd
+    reuters_list_df = pd.DataFrame(records)
+    #Check if any new information was
+    if 'date' in  reuters_list_df.columns:
+        # Formats the date column as a pandas date-time format
+        reuters_list_df['date'] = pd.to_datetime(reuters_list_df['date'], errors='coerce')
+    return reuters_list_df
 
-"""
+
+# Save news object
+# Appends the new records to the loaded news and writes the whole news object to output_file
+# Returns the combined dataframe
+def save_news(old_news_df, records, output_file):
+    import pandas as pd
+    reuters_list_df = records_df(records)
+    # Updated to use pandas concat function 
+    output_reuters_df = pd.concat([old_news_df, reuters_list_df], ignore_index=True)
+    # Save output to JSON file using pandas
+    output_reuters_df.to_json(path_or_buf=output_file)
+    return output_reuters_df
+
+
+"""
+NEWS STORE
+"""
+
+# News store layout
+# A store is a directory of JSON Lines files holding one article record per line
+#   segment-<n>.jsonl  the articles saved by one flush, n increases with every segment
+#   base-<n>.jsonl     the compacted contents of every segment up to and including n
+# Only the newest base file and the segments after it are live, older files are left over from a compaction and
+# are removed by the next one. Every file is written under a temporary name and renamed into place, so a crash
+# never leaves a partial file in the store.
+NEWS_COLUMNS = ['date', 'time', 'source', 'Title', 'Text', 'url']
+STORE_COMPACT_SEGMENTS = 16
+store_file_pattern = re.compile(r'^(base|segment)-(\d+)\.jsonl$')
+
+
+# get store directory
+# The store for news_dump_object.json is news_dump_object_store
+def get_store_dir(news_object_file):
+    return os.path.splitext(news_object_file)[0] + '_store'
+
+
+# list store files
+# Returns the live files of the store in read order and the files superseded by a compaction
+def list_store_files(store_dir):
+    bases = []
+    segments = []
+    if os.path.isdir(store_dir):
+        for name in os.listdir(store_dir):
+            match = store_file_pattern.match(name)
+            if match:
+                entry = (int(match.group(2)), os.path.join(store_dir, name))
+                (bases if match.group(1) == 'base' else segments).append(entry)
+    bases.sort()
+    segments.sort()
+    base_seq = bases[-1][0] if bases else -1
+    live = bases[-1:] + [entry for entry in segments if entry[0] > base_seq]
+    dead = bases[:-1] + [entry for entry in segments if entry[0] <= base_seq]
+    return [path for _, path in live], [path for _, path in dead]
+
+
+# next sequence number
+def next_store_seq(store_dir):
+    live, dead = list_store_files(store_dir)
+    seqs = [int(store_file_pattern.match(os.path.basename(path)).group(2)) for path in live + dead]
+    return max(seqs) + 1 if seqs else 0
+
+
+# store date
+# Dates arrive as 'YYYY-M-D' strings from the scraper or as timestamps from a migrated JSON news object
+# Returns the date as a YYYY-MM-DD string, None if it is missing or not a date
+def store_date(date):
+    try:
+        if isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d')
+        return date.strftime('%Y-%m-%d')
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+# store record
+# Normalizes a record for the store, dates are kept as YYYY-MM-DD strings
+def store_record(record):
+    out_record = dict(record)
+    out_record['date'] = store_date(out_record.get('date'))
+    return out_record
+
+
+# write store file
+# Writes lines to path through a temporary file in the same directory and renames it into place
+def write_store_file(path, lines):
+    store_dir = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as out_file:
+            for line in lines:
+                out_file.write(line)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# URL index path
+# Every store file has a sidecar with the URLs of its records, one per line in record order
+def url_index_path(path):
+    return os.path.splitext(path)[0] + '.urls'
+
+
+# write records
+# Writes a store file and its URL index, the index goes first so a live store file always has one
+def write_records(path, records):
+    records = [store_record(record) for record in records]
+    write_store_file(url_index_path(path), (str(record.get('url')) + '\n' for record in records))
+    write_store_file(path, (json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+
+
+# write segment
+# Appends records to the store as a new segment, returns the segment path (None if there was nothing to write)
+# Updated to keep the URL index and, if the store has one, the URL Bloom filter in sync
+def write_segment(store_dir, records):
+    if not records:
+        return None
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, 'segment-%08d.jsonl' % next_store_seq(store_dir))
+    write_records(path, records)
+    if os.path.isfile(url_bloom_path(store_dir)):
+        update_url_bloom(store_dir, [record.get('url') for record in records])
+    return path
+
+
+# iterate store lines
+# Yields the raw JSON lines of the live store files in order
+def iter_store_lines(store_dir):
+    live, _ = list_store_files(store_dir)
+    for path in live:
+        with open(path, 'r', encoding='utf-8') as in_file:
+            for line in in_file:
+                if line.strip():
+                    yield line
+
+
+# iterate store
+# Yields the article records of the store one at a time without loading the whole store
+def iter_store(store_dir):
+    for line in iter_store_lines(store_dir):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            print('NOTICE: skipping unreadable record in', store_dir)
+
+
+# Load store
+# Returns the whole store as a news dataframe with columns ["date", "time", "source", "Title", "Text", "url"]
+def load_store(store_dir):
+    import pandas as pd
+    news_df = records_df(list(iter_store(store_dir)))
+    if news_df.empty:
+        news_df = pd.DataFrame(columns=NEWS_COLUMNS)
+    return news_df
+
+
+# Compact store
+# Merges the live files into one base file and removes superseded files
+# Returns True if the store was compacted
+def compact_store(store_dir, min_segments=STORE_COMPACT_SEGMENTS):
+    live, _ = list_store_files(store_dir)
+    compacted = len(live) > min_segments
+    if compacted:
+        last_seq = int(store_file_pattern.match(os.path.basename(live[-1])).group(2))
+        base_path = os.path.join(store_dir, 'base-%08d.jsonl' % last_seq)
+        write_store_file(url_index_path(base_path), iter_url_index_lines(store_dir))
+        write_store_file(base_path, iter_store_lines(store_dir))
+    remove_dead_files(store_dir)
+    return compacted
+
+
+# remove dead files
+# Removes the store files superseded by a newer base file, with their URL indexes
+def remove_dead_files(store_dir):
+    _, dead = list_store_files(store_dir)
+    for path in dead:
+        os.remove(path)
+        if os.path.isfile(url_index_path(path)):
+            os.remove(url_index_path(path))
+
+
+# Migrate news object
+# Copies an existing JSON news object into a new store, nothing is done if the store already exists
+# The JSON file itself is left untouched
+def migrate_news_object(news_object_file, store_dir):
+    import pandas as pd
+    if list_store_files(store_dir)[0] or not os.path.isfile(news_object_file):
+        return False
+    try:
+        old_news_df = pd.read_json(news_object_file)
+    except ValueError:
+        return False
+    print('Migrating', news_object_file, 'to news store', store_dir, '...')
+    os.makedirs(store_dir, exist_ok=True)
+    write_records(os.path.join(store_dir, 'base-%08d.jsonl' % 0), old_news_df.to_dict('records'))
+    return True
+
+
+"""
+URL INDEX
+"""
+
+# URL Bloom filter settings
+# urls.bloom holds a Bloom filter of every stored URL, sized for URL_BLOOM_CAPACITY URLs (or twice the stored URLs,
+# whichever is larger) with a false positive rate of URL_BLOOM_ERROR. It is rebuilt from the URL index when full.
+URL_BLOOM_CAPACITY = 100000
+URL_BLOOM_ERROR = 0.001
+
+
+# iterate URL index lines
+# Yields the URL index lines of the live store files, rebuilding the index of any file that is missing one
+def iter_url_index_lines(store_dir):
+    live, _ = list_store_files(store_dir)
+    for path in live:
+        index_path = url_index_path(path)
+        if not os.path.isfile(index_path):
+            with open(path, 'r', encoding='utf-8') as in_file:
+                urls = [str(json.loads(line).get('url')) + '\n' for line in in_file if line.strip()]
+            write_store_file(index_path, urls)
+        with open(index_path, 'r', encoding='utf-8') as in_file:
+            for line in in_file:
+                yield line
+
+
+# Load URL index
+# Returns the list of stored URLs without reading any article text
+def load_url_index(store_dir):
+    return [line.rstrip('\n') for line in iter_url_index_lines(store_dir)]
+
+
+# URL Bloom filter file
+def url_bloom_path(store_dir):
+    return os.path.join(store_dir, 'urls.bloom')
+
+
+# new Bloom filter
+# A Bloom filter is a dict of its size in bits (m), number of hashes (k), number of URLs added (count),
+# capacity and bit array
+def new_bloom(capacity, error_rate=URL_BLOOM_ERROR):
+    capacity = max(int(capacity), 1)
+    m = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    k = max(int(round(m / capacity * math.log(2))), 1)
+    return {'m': m, 'k': k, 'count': 0, 'capacity': capacity, 'bits': bytearray((m + 7) // 8)}
+
+
+# Bloom filter bit positions, double hashing of one blake2b digest
+def bloom_positions(bloom, url):
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % bloom['m'] for i in range(bloom['k'])]
+
+
+def bloom_add(bloom, url):
+    for position in bloom_positions(bloom, url):
+        bloom['bits'][position >> 3] |= 1 << (position & 7)
+    bloom['count'] += 1
+
+
+def bloom_contains(bloom, url):
+    bits = bloom['bits']
+    return all(bits[position >> 3] & (1 << (position & 7)) for position in bloom_positions(bloom, url))
+
+
+# save and load Bloom filter
+# The file is a one line JSON header followed by the bit array
+def save_bloom(bloom, path):
+    header = json.dumps({key: bloom[key] for key in ('m', 'k', 'count', 'capacity')}).encode('utf-8') + b'\n'
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out_file:
+        out_file.write(header)
+        out_file.write(bytes(bloom['bits']))
+    os.replace(tmp_path, path)
+
+
+def load_bloom(path):
+    with open(path, 'rb') as in_file:
+        bloom = json.loads(in_file.readline().decode('utf-8'))
+        bloom['bits'] = bytearray(in_file.read())
+    return bloom
+
+
+# Build URL Bloom filter
+# Builds urls.bloom from the URL index and returns it
+def build_url_bloom(store_dir, capacity=URL_BLOOM_CAPACITY):
+    urls = load_url_index(store_dir)
+    bloom = new_bloom(max(capacity, 2 * len(urls)))
+    for url in urls:
+        bloom_add(bloom, url)
+    os.makedirs(store_dir, exist_ok=True)
+    save_bloom(bloom, url_bloom_path(store_dir))
+    return bloom
+
+
+# Update URL Bloom filter
+# Adds urls to urls.bloom, rebuilding it with more room once it holds more URLs than its capacity
+def update_url_bloom(store_dir, urls):
+    bloom = load_bloom(url_bloom_path(store_dir))
+    if bloom['count'] + len(urls) > bloom['capacity']:
+        return build_url_bloom(store_dir)
+    for url in urls:
+        bloom_add(bloom, str(url))
+    save_bloom(bloom, url_bloom_path(store_dir))
+    return bloom
+
+
+# URL index
+# Container of the stored URLs for url_check()
+# The Bloom filter is a prefilter: a URL it has not seen is new without reading anything else, a URL it has seen is
+# confirmed by streaming the URL index. confirm() checks a batch of URLs in one pass over the index, the answers are
+# kept so url_check() does not read the index again for them.
+class UrlIndex:
+    def __init__(self, store_dir):
+        if not os.path.isfile(url_bloom_path(store_dir)):
+            build_url_bloom(store_dir)
+        self.store_dir = store_dir
+        self.bloom = load_bloom(url_bloom_path(store_dir))
+        self.confirmed = {}
+
+    def confirm(self, urls):
+        candidates = {url for url in urls
+                      if url is not None and url not in self.confirmed and bloom_contains(self.bloom, url)}
+        if not candidates:
+            return
+        stored = set()
+        for line in iter_url_index_lines(self.store_dir):
+            url = line.rstrip('\n')
+            if url in candidates:
+                stored.add(url)
+        for url in candidates:
+            self.confirmed[url] = url in stored
+        count_metric('bloom_false_positives', len(candidates) - len(stored))
+
+    def __contains__(self, url):
+        if url is None or not bloom_contains(self.bloom, url):
+            return False
+        if url not in self.confirmed:
+            self.confirm([url])
+        return self.confirmed[url]
+
+    def __len__(self):
+        return self.bloom['count']
+
+
+# Open store
+# Store version of open_file(), returns the number of stored articles and the set of their URLs
+# Updated to read the URL index instead of the articles, url_index='bloom' returns a UrlIndex instead of a set
+def open_store(store_dir, url_index='exact'):
+    if url_index == 'bloom':
+        old_url_set = UrlIndex(store_dir)
+        return len(old_url_set), old_url_set
+    urls = load_url_index(store_dir)
+    return len(urls), set(urls)
+
+
+# Export news object
+# Writes the store out as a JSON news object in the format main(storage='json') uses
+def export_news_object(store_dir, news_object_file):
+    load_store(store_dir).to_json(path_or_buf=news_object_file)
+
+
+"""
+NEAR DUPLICATES
+"""
+
+# Near duplicate settings
+# Articles are compared on the DUPLICATE_SHINGLE word shingles of their Title and Text. Each article gets a MinHash
+# signature of MINHASH_PERMUTATIONS values cut into LSH_BANDS bands. Articles sharing a band are candidates, and a
+# candidate agreeing on at least DUPLICATE_THRESHOLD of the values (the estimated Jaccard similarity of the
+# shingles) is a near duplicate. With 32 bands of 4 values articles about 0.4 similar or more are likely candidates.
+DUPLICATE_SHINGLE = 5
+DUPLICATE_THRESHOLD = 0.5
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+MINHASH_PRIME = (1 << 31) - 1
+minhash_parameters = {}
+
+
+# shingles
+# Returns the set of hashes of the word shingles of a record's Title and Text
+def shingles(record, size=DUPLICATE_SHINGLE):
+    text = ' '.join(field for field in (record.get('Title'), record.get('Text')) if isinstance(field, str))
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return set()
+    return {int.from_bytes(hashlib.blake2b(' '.join(words[i:i + size]).encode('utf-8'), digest_size=4).digest(),
+                           'little') & MINHASH_PRIME
+            for i in range(max(len(words) - size + 1, 1))}
+
+
+# MinHash signature
+# Minimum of each of MINHASH_PERMUTATIONS random hash functions (a * x + b) % MINHASH_PRIME over the shingles
+# Returns the signature as a uint32 array, None if the record has no text
+def minhash_signature(record):
+    import numpy as np
+    hashes = shingles(record)
+    if not hashes:
+        return None
+    if not minhash_parameters:
+        generator = np.random.RandomState(1)
+        minhash_parameters['a'] = generator.randint(1, MINHASH_PRIME, MINHASH_PERMUTATIONS).astype(np.uint64)
+        minhash_parameters['b'] = generator.randint(0, MINHASH_PRIME, MINHASH_PERMUTATIONS).astype(np.uint64)
+    x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    a, b = minhash_parameters['a'][:, None], minhash_parameters['b'][:, None]
+    return ((a * x[None, :] + b) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+
+# new duplicate index
+# The LSH index is a dict of the signatures by URL, the original of every indexed URL (itself unless it is a
+# duplicate) and the URLs in each band bucket
+def new_duplicate_index():
+    return {'signatures': {}, 'originals': {}, 'buckets': {}}
+
+
+# LSH band keys of a signature
+def lsh_keys(signature):
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+
+
+# index signature
+# Adds a URL to the index, signature may be None for articles without text
+def index_signature(index, url, signature, original=None):
+    index['originals'][url] = original or url
+    if signature is None:
+        return
+    index['signatures'][url] = signature
+    for key in lsh_keys(signature):
+        index['buckets'].setdefault(key, []).append(url)
+
+
+# find duplicate
+# Looks signature up in the index, only the URLs sharing a band with it are compared
+# Returns the original of the most similar candidate within DUPLICATE_THRESHOLD, None if there is none
+def find_duplicate(index, signature, url=None):
+    best, best_similarity = None, DUPLICATE_THRESHOLD
+    seen = {url}
+    for key in lsh_keys(signature):
+        for candidate in index['buckets'].get(key, ()):
+            if candidate in seen:
+                continue
+            seen.add(candidate)
+            similarity = float((index['signatures'][candidate] == signature).mean())
+            if similarity > best_similarity or (best is None and similarity >= best_similarity):
+                best, best_similarity = candidate, similarity
+    return index['originals'][best] if best is not None else None
+
+
+# duplicate of
+# Returns the URL a record was flagged as a duplicate of, None for originals
+def duplicate_of(record):
+    original = record.get('duplicate_of')
+    return original if isinstance(original, str) else None
+
+
+# Mark duplicate
+# Checks record against the index and adds it to the index. A near duplicate is returned with duplicate_of set to
+# the URL of the original article, and with collapse=True without its Text so only its metadata is stored.
+def mark_duplicate(index, record, collapse=False):
+    url = str(record.get('url'))
+    signature = minhash_signature(record)
+    original = find_duplicate(index, signature, url) if signature is not None else None
+    index_signature(index, url, signature, original)
+    if original is None:
+        return record
+    record = dict(record, duplicate_of=original)
+    if collapse:
+        record['Text'] = None
+    return record
+
+
+# Build duplicate index
+# Indexes records as they are, keeping the duplicate_of they were stored with
+def build_duplicate_index(records, index=None):
+    index = new_duplicate_index() if index is None else index
+    for record in records:
+        url = str(record.get('url'))
+        if url not in index['originals']:
+            index_signature(index, url, minhash_signature(record), duplicate_of(record))
+    return index
+
+
+# duplicate index file
+# minhash.jsonl has a line [url, base64 signature or null, duplicate_of or null] per stored article
+def duplicate_index_path(store_dir):
+    return os.path.join(store_dir, 'minhash.jsonl')
+
+
+def duplicate_index_line(index, url):
+    signature = index['signatures'].get(url)
+    original = index['originals'].get(url)
+    return json.dumps([url, base64.b64encode(signature.tobytes()).decode('ascii') if signature is not None else None,
+                       original if original != url else None]) + '\n'
+
+
+# append duplicate index
+# Appends the index lines of urls to minhash.jsonl
+def append_duplicate_index(store_dir, index, urls):
+    with open(duplicate_index_path(store_dir), 'a', encoding='utf-8') as out_file:
+        for url in urls:
+            out_file.write(duplicate_index_line(index, str(url)))
+        out_file.flush()
+        os.fsync(out_file.fileno())
+
+
+# Open duplicate index
+# Loads the store's minhash.jsonl and indexes any stored article missing from it (all of them the first time)
+def open_duplicate_index(store_dir):
+    import numpy as np
+    index = new_duplicate_index()
+    try:
+        with open(duplicate_index_path(store_dir), 'r', encoding='utf-8') as in_file:
+            for line in in_file:
+                try:
+                    url, signature, original = json.loads(line)
+                except ValueError:
+                    continue
+                if signature is not None:
+                    signature = np.frombuffer(base64.b64decode(signature), dtype=np.uint32)
+                index_signature(index, url, signature, original)
+    except OSError:
+        pass
+    missing = [url for url in load_url_index(store_dir) if url not in index['originals']]
+    if missing:
+        print('NOTICE: indexing', len(missing), 'stored articles for near duplicate detection')
+        missing_urls = set(missing)
+        build_duplicate_index((record for record in iter_store(store_dir)
+                               if str(record.get('url')) in missing_urls), index)
+        os.makedirs(store_dir, exist_ok=True)
+        append_duplicate_index(store_dir, index, missing)
+    return index
+
+
+# Dedupe store
+# Batch pass over the stored articles in order, flagging the near duplicates of earlier articles (see
+# mark_duplicate()). Articles already collapsed keep their flag. The store is only rewritten, as one new base file,
+# if a flag changed, and its aggregates are then rebuilt. Returns the number of duplicates.
+def dedupe_store(store_dir, collapse=False):
+    index = new_duplicate_index()
+    records = []
+    changed = False
+    for record in iter_store(store_dir):
+        if duplicate_of(record) and not isinstance(record.get('Text'), str):
+            index_signature(index, str(record.get('url')), None, duplicate_of(record))
+            records.append(record)
+            continue
+        marked = mark_duplicate(index, {key: value for key, value in record.items() if key != 'duplicate_of'},
+                                collapse)
+        changed = changed or marked != record
+        records.append(marked)
+    if changed:
+        write_records(os.path.join(store_dir, 'base-%08d.jsonl' % next_store_seq(store_dir)), records)
+        remove_dead_files(store_dir)
+    write_store_file(duplicate_index_path(store_dir),
+                     (duplicate_index_line(index, str(record.get('url'))) for record in records))
+    duplicates = sum(1 for record in records if duplicate_of(record))
+    print(duplicates, 'near duplicates among', len(records), 'stored articles')
+    aggregates = load_aggregates(aggregates_path(store_dir))
+    if changed and aggregates is not None:
+        rebuild_aggregates(store_dir, aggregates['topic'], aggregates['entities'], aggregates['include_title'])
+    return duplicates
+
+
+"""
+SEARCH INDEX
+"""
+
+# Search settings
+# search.sqlite holds a documents table of the url, date and source of each stored article and an FTS5 table of
+# their Title and Text with the same rowid. BM25 counts a Title match SEARCH_TITLE_WEIGHT times a Text match.
+SEARCH_TITLE_WEIGHT = 2.0
+SEARCH_SNIPPET_WORDS = 16
+
+
+# search index path
+def search_index_path(store_dir):
+    return os.path.join(store_dir, 'search.sqlite')
+
+
+# Index articles
+# Adds the records not indexed yet to the search index
+def index_articles(connection, records):
+    for record in records:
+        cursor = connection.execute('INSERT OR IGNORE INTO documents (url, date, source) VALUES (?, ?, ?)',
+                                    (str(record.get('url')), store_date(record.get('date')), record.get('source')))
+        if cursor.rowcount:
+            connection.execute('INSERT INTO articles (rowid, Title, Text) VALUES (?, ?, ?)',
+                               (cursor.lastrowid, record.get('Title'), record.get('Text')))
+    connection.commit()
+
+
+# Open search index
+# Returns a connection to the store's search index, indexing any stored article missing from it first (all of
+# them the first time)
+def open_search_index(store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    connection = sqlite3.connect(search_index_path(store_dir))
+    connection.execute('CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, url TEXT UNIQUE, date TEXT, '
+                       'source TEXT)')
+    connection.execute('CREATE INDEX IF NOT EXISTS documents_date ON documents (date)')
+    connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5(Title, Text, "
+                       "tokenize='porter unicode61')")
+    indexed = {row[0] for row in connection.execute('SELECT url FROM documents')}
+    missing = {url for url in load_url_index(store_dir) if url not in indexed}
+    if missing:
+        print('NOTICE: adding', len(missing), 'stored articles to the search index')
+        index_articles(connection, (record for record in iter_store(store_dir)
+                                    if str(record.get('url')) in missing))
+    return connection
+
+
+# Search news
+# Searches the stored articles of file_path (a news store or a JSON news object with a store next to it) for query,
+# an FTS5 query such as 'coronavirus AND Trump', '"trade deal"' or 'vaccin*'
+# start and end are inclusive YYYY-MM-DD dates, source an exact source name
+# Returns up to limit dicts of url, date, source, Title, score (BM25, lower is better) and snippet, best first
+def search_news(query, file_path='news_dump_object.json', start=None, end=None, source=None, limit=10):
+    store_dir = file_path if os.path.isdir(file_path) else get_store_dir(file_path)
+    connection = open_search_index(store_dir)
+    try:
+        rows = connection.execute(
+            "SELECT documents.url, documents.date, documents.source, articles.Title, "
+            "bm25(articles, ?, 1.0) AS score, snippet(articles, 1, '[', ']', '...', ?) "
+            "FROM articles JOIN documents ON documents.id = articles.rowid "
+            "WHERE articles MATCH ? AND (? IS NULL OR documents.date >= ?) AND (? IS NULL OR documents.date <= ?) "
+            "AND (? IS NULL OR documents.source = ?) ORDER BY score LIMIT ?",
+            (SEARCH_TITLE_WEIGHT, SEARCH_SNIPPET_WORDS, query, start, start, end, end, source, source, limit)
+        ).fetchall()
+    finally:
+        connection.close()
+    return [dict(zip(['url', 'date', 'source', 'Title', 'score', 'snippet'], row)) for row in rows]
+
+
+"""
+PAGE ARCHIVE
+"""
+
+# Page archive settings
+# main(archive=True) keeps the raw HTML of every article page downloaded with a 200 status in the news store, so the
+# articles can be extracted again without the network when the extraction rules change (see reextract_store())
+# pages.warc.gz holds one WARC/1.0 response record per page, each compressed as its own gzip member so the file can
+# only be appended to and any record can be read on its own. pages.idx has a JSON line [url, offset, length, date]
+# per record and is written after the record, the last record of a URL is the one used.
+page_archive = {}
+
+
+# page archive files
+def page_archive_path(store_dir):
+    return os.path.join(store_dir, 'pages.warc.gz')
+
+
+def page_archive_index_path(store_dir):
+    return os.path.join(store_dir, 'pages.idx')
+
+
+# Load page archive index
+# Returns a dict of url: (offset, length) of the last archived record of each URL, in archive order
+def load_page_archive_index(store_dir):
+    index = {}
+    try:
+        with open(page_archive_index_path(store_dir), 'r', encoding='utf-8') as in_file:
+            for line in in_file:
+                try:
+                    url, offset, length, _ = json.loads(line)
+                except ValueError:
+                    continue
+                index.pop(url, None)
+                index[url] = (offset, length)
+    except OSError:
+        pass
+    return index
+
+
+# Open page archive
+# Starts archiving the article pages downloaded by get_html() to the store's archive
+# A record left without an index line by an interrupted run is cut off the end of the archive
+def open_page_archive(store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_page_archive_index(store_dir)
+    end = max((offset + length for offset, length in index.values()), default=0)
+    path = page_archive_path(store_dir)
+    if os.path.isfile(path) and os.path.getsize(path) > end:
+        print('NOTICE: dropping', os.path.getsize(path) - end, 'unindexed bytes from the end of', path)
+        with open(path, 'r+b') as archive_file:
+            archive_file.truncate(end)
+    page_archive.update({'lock': threading.Lock(), 'file': open(path, 'ab'),
+                         'index': open(page_archive_index_path(store_dir), 'a', encoding='utf-8'),
+                         'pages': 0})
+    return page_archive
+
+
+# Close page archive
+# Returns the number of pages archived since open_page_archive()
+def close_page_archive():
+    if not page_archive:
+        return 0
+    pages = page_archive['pages']
+    page_archive['file'].close()
+    page_archive['index'].close()
+    page_archive.clear()
+    return pages
+
+
+# WARC record
+# Returns the WARC response record of a downloaded page, the body is stored decoded so the Content-Encoding,
+# Transfer-Encoding and Content-Length headers are replaced by the Content-Length of the stored body
+def warc_record(url, response, date):
+    body = response.content
+    http_headers = ['HTTP/1.1 ' + str(response.status_code) + ' ' + (response.reason or '')]
+    http_headers += [name + ': ' + value for name, value in response.headers.items()
+                     if name.lower() not in STORED_DROP_HEADERS]
+    http_headers.append('Content-Length: ' + str(len(body)))
+    block = ('\r\n'.join(http_headers) + '\r\n\r\n').encode('iso-8859-1', 'replace') + body
+    warc_headers = ['WARC/1.0', 'WARC-Type: response', 'WARC-Record-ID: <urn:uuid:' + str(uuid.uuid4()) + '>',
+                    'WARC-Date: ' + date, 'WARC-Target-URI: ' + url,
+                    'Content-Type: application/http; msgtype=response', 'Content-Length: ' + str(len(block))]
+    return ('\r\n'.join(warc_headers) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+
+
+# Archive page
+# Appends a downloaded article page to the open page archive, pages with another status than 200 are not kept
+def archive_page(url, response):
+    if not page_archive or response.status_code != 200:
+        return
+    date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    member = gzip.compress(warc_record(url, response, date))
+    with page_archive['lock']:
+        offset = page_archive['file'].tell()
+        page_archive['file'].write(member)
+        page_archive['file'].flush()
+        page_archive['index'].write(json.dumps([url, offset, len(member), date]) + '\n')
+        page_archive['index'].flush()
+        page_archive['pages'] += 1
+
+
+# Read archived page
+# Returns the body of the record of length bytes at offset in an open archive file
+def read_archived_page(archive_file, offset, length):
+    archive_file.seek(offset)
+    record = gzip.decompress(archive_file.read(length))
+    _, block = record.split(b'\r\n\r\n', 1)
+    _, body = block.split(b'\r\n\r\n', 1)
+    return body[:-4] if body.endswith(b'\r\n\r\n') else body
 
 
-def main(browser_agent="Chrome", news_object_file='news_dump_object.json'):
+# Re-extract chunk
+# Runs extract_article() over a chunk of (url, offset, length) archive entries, in a worker process
+# Returns the records in chunk order, None for the pages that could not be decoded
+# rules are the EXTRACTION_RULES of the main process, which a spawned worker would not see
+def reextract_chunk(entries, archive_path, rules=None):
+    if rules is not None:
+        EXTRACTION_RULES.update(rules)
+    records = []
+    with open(archive_path, 'rb') as archive_file:
+        for url, offset, length in entries:
+            try:
+                tree = html.fromstring(read_archived_page(archive_file, offset, length))
+            except (OSError, EOFError, ValueError, etree.ParserError) as error:
+                print('Unable to read archived page', url, '(' + type(error).__name__ + ')')
+                records.append(None)
+                continue
+            records.append(extract_article(tree, url))
+    return records
+
+
+# Re-extract store
+# Extracts every archived page again with the current EXTRACTION_RULES, in workers processes, without the network
+# Stored articles are updated with the new date, time, source, Title and Text, archived pages that were not stored
+# (e.g. because they could not be decoded) are added at the end. The store is only rewritten, as one new base file,
+# if an article changed. Its aggregates are then rebuilt, and its near duplicate and search indexes removed to be
+# rebuilt the next time they are opened.
+# Returns the number of articles updated and added
+def reextract_store(store_dir, workers=None, chunk_size=64):
+    index = load_page_archive_index(store_dir)
+    if not index:
+        print('NOTICE: no archived pages in', store_dir)
+        return 0, 0
+    extracted = {}
+    entries = [(url, offset, length) for url, (offset, length) in sorted(index.items(), key=lambda item: item[1])]
+    worker = partial(reextract_chunk, archive_path=page_archive_path(store_dir),
+                     rules={source: dict(rules) for source, rules in EXTRACTION_RULES.items()})
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk, chunk_records in iter_ordered(executor, worker, iter_chunks(entries, chunk_size), 2 * workers):
+            for (url, _, _), record in zip(chunk, chunk_records):
+                if record is not None:
+                    extracted[url] = record
+    records = []
+    updated = 0
+    for record in iter_store(store_dir):
+        new_record = extracted.pop(str(record.get('url')), None)
+        if new_record is not None:
+            merged = store_record(dict(record, **new_record))
+            if merged != record:
+                updated += 1
+                record = merged
+        records.append(record)
+    added = [extracted[url] for url in index if url in extracted]
+    print(len(index), 'archived pages,', updated, 'stored articles updated,', len(added), 'added')
+    if updated or added:
+        records.extend(added)
+        write_records(os.path.join(store_dir, 'base-%08d.jsonl' % next_store_seq(store_dir)), records)
+        remove_dead_files(store_dir)
+        if added and os.path.isfile(url_bloom_path(store_dir)):
+            update_url_bloom(store_dir, [record.get('url') for record in added])
+        for path in (duplicate_index_path(store_dir), search_index_path(store_dir)):
+            if os.path.isfile(path):
+                os.remove(path)
+        aggregates = load_aggregates(aggregates_path(store_dir))
+        if aggregates is not None:
+            rebuild_aggregates(store_dir, aggregates['topic'], aggregates['entities'], aggregates['include_title'])
+    return updated, len(added)
+
+
+# Save records
+# Saves the records scraped since the last save, to a new segment if store_dir is given and otherwise by rewriting
+# the JSON news object. Returns the loaded news with the records appended when the JSON news object is rewritten,
+# old_news_df otherwise.
+# Updated to take the unsaved records only, so main() can drop the records it has saved
+# Updated to add the saved records to the store's analysis aggregates when they are given (see open_aggregates())
+# and to the store's near duplicate index when it is given (see open_duplicate_index())
+# and to the store's search index when a connection to it is given (see open_search_index())
+def save_records(records, store_dir=None, old_news_df=None, output_file=None, aggregates=None, duplicates=None,
+                 search=None):
+    with run_stage('store'):
+        if store_dir:
+            write_segment(store_dir, records)
+        else:
+            old_news_df = save_news(old_news_df, records, output_file)
+    if store_dir and search is not None:
+        with run_stage('search_index'):
+            index_articles(search, records)
+    if store_dir and duplicates is not None and records:
+        append_duplicate_index(store_dir, duplicates, [record.get('url') for record in records])
+    if store_dir and aggregates is not None:
+        with run_stage('aggregates'):
+            update_aggregates(aggregates, records)
+            save_aggregates(aggregates, aggregates_path(store_dir))
+    return old_news_df
+
+
+"""
+MAIN SCRIPT
+Updated function to allow user to specify a browser agent and news_dump_object filename
+If not specified the code will default to a browser agent of "Chrome" and filename of "news_dump_object.json"
+listing and listing_pages select how the theWire listing is read (see reuters()), the browser agent is only
+started when listing='browser' or the HTTP listing fails
+listing_wait is the most seconds the browser waits for a listing page, lean_browser=False loads the listing pages
+with images, fonts and stylesheets (see get_html_scroll())
+keep_browser=True keeps started browsers in the pool for the next main() call
+flush_every saves the news object after every flush_every new articles, window bounds the articles in flight
+storage='jsonl' (default) keeps the news in the append-only store [filename]_store, storage='json' rewrites the
+JSON file as before
+url_index='bloom' checks for new articles against the store's URL Bloom filter instead of loading its URL index,
+only the links the filter has seen are looked up in the URL index
+max_workers and max_per_host control how many articles are downloaded at once (see get_html_reuters())
+aggregates=True adds the new articles to the store's analysis aggregates (see open_aggregates())
+duplicates='flag' flags new articles that are near duplicates of earlier ones, 'collapse' also drops their text
+(see mark_duplicate())
+search_index=True adds the new articles to the store's full text search index (see search_news())
+http_cache=True sends conditional requests for the pages in the HTTP cache (see open_http_cache())
+archive=True keeps the raw HTML of the downloaded articles in the store's page archive (see reextract_store())
+profile_dir profiles the run into that directory (see start_profiling())
+return_output=False returns None instead of the JSON of the new articles (the whole news object with
+storage='json'), which the store would otherwise read back
+with_metrics=True returns (output, metrics) with the run metrics (see get_run_metrics()), metrics_file saves them
+as JSON or, for a .prom file, in the Prometheus text format
+
+"""
+
+
+def main(browser_agent="Chrome", news_object_file='news_dump_object.json', max_workers=8, max_per_host=4,
+         listing='http', listing_pages=LISTING_PAGES, listing_wait=LISTING_MAX_WAIT, lean_browser=True,
+         keep_browser=True, flush_every=50, window=None, storage='jsonl', url_index='exact', aggregates=False,
+         duplicates=None, search_index=False, archive=False, http_cache=False, return_output=True, with_metrics=False,
+         metrics_file=None, profile_dir=None):
+    if profile_dir and start_profiling(profile_dir):
+        arguments = dict(locals(), profile_dir=None)
+        try:
+            return main(**arguments)
+        finally:
+            stop_profiling()
+    reset_run_metrics()
+    run_start = time.perf_counter()
+    start_stats = get_fetch_stats()
     banner()
     # Check if the requested browser agent is Firefox or Chrome
     # If no agent is passed code will default to Chrome
     if browser_agent == "Chrome" or browser_agent == "Firefox":
         print("Executing using", browser_agent, "webdriver")
-        if browser_agent == "Chrome":
-            check_chrome()
     else:
         print(browser_agent, " is not a recognized browser agent, please use 'Firefox' or 'Chrome'")
     news_object_path = os.getcwd()
     output_path = os.getcwd()
-    # updated below line of code to allow user to specify a news_object_filename
-    old_news_df, old_url_set = open_file(news_object_path, news_object_file) # loads the file
-    print(old_news_df.index.size, 'articles loaded from', news_object_file) # inform user of how many articles loaded
-    
-    # Run the webscraper and save output to dataframe
-    reuters_list_df = pd.DataFrame(reuters(old_url_set, browser_agent))
-    print(reuters_list_df.index.size, 'new articles scraped') #display how many articles scraped
-    #Check if any new information was
-    if 'date' in  reuters_list_df.columns:
-        # Formats the date column as a pandas date-time format
-        reuters_list_df['date'] = reuters_list_df['date'].astype('datetime64') 
-    
-    # Updated to use pandas concat function 
-    output_reuters_df = pd.concat([old_news_df, reuters_list_df], ignore_index=True)
+    output_file = os.path.join(output_path, news_object_file)
+    with run_stage('load'):
+        if storage == 'jsonl':
+            # the store only ever receives the new articles, the JSON file is only read once to migrate it
+            store_dir = os.path.join(output_path, get_store_dir(news_object_file))
+            migrate_news_object(os.path.join(news_object_path, news_object_file), store_dir)
+            old_news_df = None
+            article_count, old_url_set = open_store(store_dir, url_index)
+            print(article_count, 'articles loaded from', store_dir)
+        else:
+            store_dir = None
+            # updated below line of code to allow user to specify a news_object_filename
+            old_news_df, old_url_set = open_file(news_object_path, news_object_file) # loads the file
+            print(old_news_df.index.size, 'articles loaded from', news_object_file) # inform user of how many articles loaded
+        aggregate_state = None
+        if aggregates and store_dir:
+            aggregate_state = open_aggregates(store_dir)
+        elif aggregates:
+            print("NOTICE: analysis aggregates are kept in the news store, use storage='jsonl' to update them")
+        duplicate_index = None
+        if duplicates and store_dir:
+            duplicate_index = open_duplicate_index(store_dir)
+        elif duplicates:
+            duplicate_index = build_duplicate_index(old_news_df.to_dict('records'))
+        search = None
+        if search_index and store_dir:
+            search = open_search_index(store_dir)
+        elif search_index:
+            print("NOTICE: the search index is kept in the news store, use storage='jsonl' to update it")
+        opened_http_cache = http_cache and open_http_cache()
+        if archive and store_dir:
+            open_page_archive(store_dir)
+        elif archive:
+            print("NOTICE: the page archive is kept in the news store, use storage='jsonl' to archive pages")
+
+    # Run the webscraper, saving the news object every flush_every articles
+    # Only the records not saved yet are kept
+    records = []
+    scraped = 0
+    near_duplicates = 0
+    scrape_start = time.perf_counter()
+    try:
+        for record in iter_reuters(old_url_set, browser_agent, max_workers, max_per_host, listing, listing_pages,
+                                   window, listing_wait, lean_browser):
+            if duplicate_index is not None:
+                record = mark_duplicate(duplicate_index, record, duplicates == 'collapse')
+                near_duplicates += 1 if duplicate_of(record) else 0
+            records.append(record)
+            scraped += 1
+            if flush_every and len(records) >= flush_every:
+                old_news_df = save_records(records, store_dir, old_news_df, output_file, aggregate_state,
+                                           duplicate_index, search)
+                records = []
+    except KeyboardInterrupt:
+        print('Interrupted...keeping the articles scraped so far')
+    finally:
+        if page_archive:
+            count_metric('archived', close_page_archive())
+        if opened_http_cache:
+            close_http_cache()
+    scrape_seconds = time.perf_counter() - scrape_start
+    print(scraped, 'new articles scraped') #display how many articles scraped
+    count_metric('scraped', scraped)
+    if duplicate_index is not None:
+        count_metric('near_duplicates', near_duplicates)
+        print(near_duplicates, 'of them near duplicates')
 
     print('Saving news object...')
-    output_file = os.path.join(output_path, news_object_file)
-    # Save output to JSON file using pandas
-    output_reuters_df.to_json(path_or_buf=output_file)
-    output_reuters = output_reuters_df.to_json()
-    cleanup()
+    old_news_df = save_records(records, store_dir, old_news_df, output_file, aggregate_state, duplicate_index, search)
+    records = []
+    if search is not None:
+        search.close()
+    output_reuters = None
+    if store_dir:
+        # the new articles are the last scraped records of the store, read back before compaction
+        if return_output:
+            output_reuters = records_df(list(deque(iter_store(store_dir), maxlen=scraped))).to_json()
+        with run_stage('compact'):
+            compact_store(store_dir)
+    elif return_output:
+        output_reuters = old_news_df.to_json()
+    stats = get_fetch_stats()
+    print(stats['requests'], 'HTTP requests,', stats['retries'], 'retries,', stats['failures'], 'failures,',
+          stats['reused'], 'reused connections,', stats['not_modified'], 'not modified')
+    cleanup(keep_browser)
+    metrics = get_run_metrics()
+    metrics['seconds'] = time.perf_counter() - run_start
+    metrics['scrape_seconds'] = scrape_seconds
+    metrics['http'] = {key: stats[key] - start_stats.get(key, 0) for key in stats}
+    pages = metrics['stages'].get('fetch', {}).get('calls', 0)
+    metrics['pages_per_second'] = pages / scrape_seconds if scrape_seconds else None
+    print(pages, 'pages in', round(scrape_seconds, 1), 'seconds,', metrics['http']['bytes'], 'bytes downloaded,',
+          sum(sum(reasons.values()) for reasons in metrics['failures'].values()), 'failures')
+    if metrics_file:
+        save_metrics(metrics, metrics_file)
+    if with_metrics:
+        return output_reuters, metrics
     return output_reuters
 
 
-"""
-EXECUTE SCRIPT
-"""
-if __name__ == '__main__':
-    output_reuters = main()
-
 """
 TEXT ANALYSIS
 """
-file_path = r'news_dump_object.json'
+
+# Analysis settings
+# Sentences mentioning ANALYSIS_TOPIC are scored for each of ANALYSIS_ENTITIES (case sensitive substring matches)
+ANALYSIS_TOPIC = 'corona'
+ANALYSIS_ENTITIES = ['Trump', 'Biden', 'China', 'Russia']
+
+
 def open_text(file_path):
     with open(file_path, 'r') as document:
         text = document.read()
     return text
 
-text = open_text(file_path)
-blob = TextBlob(text)
-blob_sentences = blob.sentences
-
-corona_sentences = []
-for sentence in blob_sentences:
-    if 'corona' in sentence:
-        corona_sentences.append(sentence)
-
-trump_sentences = []
-trump_polarity = []
-trump_subjectivity = []
-for sentence in corona_sentences:
-    if 'Trump' in sentence:
-        trump_sentences.append(sentence)
-        trump_polarity.append(sentence.sentiment.polarity)
-        trump_subjectivity.append(sentence.sentiment.subjectivity)
-print("Trump Coronavirus Polarity:", np.mean(trump_polarity))
-print("Trump Coronavirus Sujectivity:", np.mean(trump_subjectivity))
-print("Trump Coronavirus Mentions:", len(trump_sentences))
-
-biden_sentences = []
-biden_polarity = []
-biden_subjectivity = []
-for sentence in corona_sentences:
-    if 'Biden' in sentence:
-        biden_sentences.append(sentence)
-        biden_polarity.append(sentence.sentiment.polarity)
-        biden_subjectivity.append(sentence.sentiment.subjectivity)
-print("Biden Coronavirus Polarity:", np.mean(biden_polarity))
-print("Biden Coronavirus Sujectivity:", np.mean(biden_subjectivity))
-print("Biden Coronavirus Mentions:", len(biden_sentences))
-
-china_sentences = []
-china_polarity = []
-china_subjectivity = []
-for sentence in corona_sentences:
-    if 'China' in sentence:
-        china_sentences.append(sentence)
-        china_polarity.append(sentence.sentiment.polarity)
-        china_subjectivity.append(sentence.sentiment.subjectivity)
-print("China Coronavirus Polarity:", np.mean(china_polarity))
-print("China Coronavirus Sujectivity:", np.mean(china_subjectivity))
-print("China Coronavirus Mentions:", len(china_sentences))
-
-russia_sentences = []
-russia_polarity = []
-russia_subjectivity = []
-for sentence in corona_sentences:
-    if 'Russia' in sentence:
-        russia_sentences.append(sentence)
-        russia_polarity.append(sentence.sentiment.polarity)
-        russia_subjectivity.append(sentence.sentiment.subjectivity)
-print("Russia Coronavirus Polarity:", np.mean(russia_polarity))
-print("Russia Coronavirus Sujectivity:", np.mean(russia_subjectivity))
-print("Russia Coronavirus Mentions:", len(russia_sentences))
\ No newline at end of file
+
+# iterate news records
+# Yields the article records of file_path, which may be a news store, a JSON news object with a store next to it
+# (see get_store_dir()), or a JSON news object without one
+# An empty store and a missing file have no records
+def iter_news_records(file_path='news_dump_object.json'):
+    store_dir = file_path if os.path.isdir(file_path) else get_store_dir(file_path)
+    if list_store_files(store_dir)[0]:
+        yield from iter_store(store_dir)
+        return
+    if not os.path.isfile(file_path):
+        return
+    import pandas as pd
+    try:
+        news_df = pd.read_json(file_path)
+    except ValueError:
+        return
+    for record in news_df.to_dict('records'):
+        yield store_record(record)
+
+
+"""
+SENTIMENT CACHE
+"""
+
+# Sentiment cache
+# SQLite database in the cache dir (see get_cache_dir()) with two tables keyed by a hash of the analyzer version and
+# the text: the sentence boundaries of each article text and the polarity and subjectivity of each sentence
+# Bump SENTIMENT_CACHE_VERSION whenever the way sentences are split or scored changes
+SENTIMENT_CACHE_VERSION = 1
+sentiment_cache_stats = {'hits': 0, 'misses': 0, 'split_hits': 0, 'split_misses': 0}
+
+
+# analyzer version
+def analyzer_version():
+    import textblob
+    from importlib import metadata
+    version = getattr(textblob, '__version__', None) or metadata.version('textblob')
+    return 'textblob-' + version + '/' + str(SENTIMENT_CACHE_VERSION)
+
+
+# content key
+def content_key(version, text):
+    return hashlib.sha256((version + '\0' + text).encode('utf-8')).hexdigest()
+
+
+# sentiment cache path
+def get_sentiment_cache_path(cache_path=None):
+    return cache_path or os.path.join(get_cache_dir(), 'sentiment_cache.sqlite')
+
+
+# Open sentiment cache
+# Returns the cache as a dict of its connection and analyzer version, entries of other versions are removed
+# A readonly cache collects its new entries in cache['rows'] instead of writing them (see write_cache_rows())
+def open_sentiment_cache(cache_path=None, readonly=False):
+    cache_path = get_sentiment_cache_path(cache_path)
+    if readonly:
+        connection = sqlite3.connect('file:' + urllib_quote(os.path.abspath(cache_path)) + '?mode=ro', uri=True)
+        return {'connection': connection, 'version': analyzer_version(), 'rows': {'splits': [], 'sentiment': []}}
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    connection = sqlite3.connect(cache_path)
+    connection.execute('CREATE TABLE IF NOT EXISTS sentiment '
+                       '(key TEXT PRIMARY KEY, version TEXT, polarity REAL, subjectivity REAL)')
+    connection.execute('CREATE TABLE IF NOT EXISTS splits (key TEXT PRIMARY KEY, version TEXT, bounds TEXT)')
+    version = analyzer_version()
+    connection.execute('DELETE FROM sentiment WHERE version != ?', (version,))
+    connection.execute('DELETE FROM splits WHERE version != ?', (version,))
+    connection.commit()
+    return {'connection': connection, 'version': version}
+
+
+# Close sentiment cache
+# Commits the new entries
+def close_sentiment_cache(cache):
+    if cache is not None:
+        cache['connection'].commit()
+        cache['connection'].close()
+
+
+# Add cache row
+# Inserts a row into a cache table, or keeps it in cache['rows'] if the cache is readonly
+def add_cache_row(cache, table, row):
+    if 'rows' in cache:
+        cache['rows'][table].append(row)
+    elif table == 'splits':
+        cache['connection'].execute('INSERT OR REPLACE INTO splits VALUES (?, ?, ?)', row)
+    else:
+        cache['connection'].execute('INSERT OR REPLACE INTO sentiment VALUES (?, ?, ?, ?)', row)
+
+
+# Write cache rows
+# Inserts the rows collected by a readonly cache
+def write_cache_rows(cache, rows):
+    for table, table_rows in rows.items():
+        for row in table_rows:
+            add_cache_row(cache, table, row)
+
+
+# get sentiment cache stats
+def get_sentiment_cache_stats():
+    return dict(sentiment_cache_stats)
+
+
+# Split sentences
+# Returns the TextBlob sentences of text as strings, using the cached sentence boundaries if there are any
+def split_sentences(text, cache=None):
+    from textblob import TextBlob
+    if cache is None:
+        return [sentence.raw for sentence in TextBlob(text).sentences]
+    key = content_key(cache['version'], text)
+    row = cache['connection'].execute('SELECT bounds FROM splits WHERE key = ?', (key,)).fetchone()
+    if row is not None:
+        sentiment_cache_stats['split_hits'] += 1
+        return [text[start:end] for start, end in json.loads(row[0])]
+    sentiment_cache_stats['split_misses'] += 1
+    sentences = TextBlob(text).sentences
+    add_cache_row(cache, 'splits', (key, cache['version'], json.dumps([[sentence.start, sentence.end]
+                                                                       for sentence in sentences])))
+    return [sentence.raw for sentence in sentences]
+
+
+# Score sentence
+# Returns the (polarity, subjectivity) of a sentence, from the cache if it has been scored before
+def score_sentence(sentence, cache=None):
+    from textblob import TextBlob
+    if cache is None:
+        sentiment = TextBlob(sentence).sentiment
+        return sentiment.polarity, sentiment.subjectivity
+    key = content_key(cache['version'], sentence)
+    row = cache['connection'].execute('SELECT polarity, subjectivity FROM sentiment WHERE key = ?',
+                                      (key,)).fetchone()
+    if row is not None:
+        sentiment_cache_stats['hits'] += 1
+        return row[0], row[1]
+    sentiment_cache_stats['misses'] += 1
+    sentiment = TextBlob(sentence).sentiment
+    add_cache_row(cache, 'sentiment', (key, cache['version'], sentiment.polarity, sentiment.subjectivity))
+    return sentiment.polarity, sentiment.subjectivity
+
+
+"""
+BATCH SENTIMENT SCORER
+"""
+
+# Batch scorer settings
+# Matching sentences are scored BATCH_SCORER_SIZE at a time. Scores agree with TextBlob's within
+# BATCH_SCORER_TOLERANCE: both average the same lexicon values in the same order, the tolerance only allows for
+# floating point differences between NumPy and Python arithmetic.
+BATCH_SCORER_SIZE = 1024
+BATCH_SCORER_TOLERANCE = 1e-12
+batch_lexicon = {}
+
+
+# get batch lexicon
+# Compiles TextBlob's pattern sentiment lexicon once: the sorted words with arrays of their polarity, subjectivity,
+# intensity and whether they are adverbs modifying the next known word, plus the negations and emoticons
+def get_batch_lexicon():
+    if not batch_lexicon:
+        import numpy as np
+        from textblob._text import EMOTICONS, PUNCTUATION
+        from textblob.en import sentiment as pattern_sentiment
+        len(pattern_sentiment)  # loads the lexicon
+        words = sorted(dict.keys(pattern_sentiment))
+        scores = [tuple(dict.__getitem__(pattern_sentiment, word)[None]) for word in words]
+        emoticons = {}
+        for (_, polarity), faces in EMOTICONS.items():
+            for face in faces:
+                emoticons.setdefault(face.lower(), polarity)
+        negations = set(pattern_sentiment.negations)
+        batch_lexicon.update({
+            'words': np.array(words),
+            'index': {word: n for n, word in enumerate(words)},
+            'scores': scores,
+            'polarity': np.array([score[0] for score in scores]),
+            'subjectivity': np.array([score[1] for score in scores]),
+            'intensity': np.array([score[2] for score in scores]),
+            'modifier': np.array([any(tag in dict.__getitem__(pattern_sentiment, word)
+                                      for tag in pattern_sentiment.modifiers) for word in words]),
+            'negations': negations,
+            'emoticons': emoticons,
+            'punctuation': PUNCTUATION,
+            'sequential': negations | {'!', '(!)'} | set(emoticons),
+            'tokenizer': pattern_sentiment.tokenizer,
+        })
+    return batch_lexicon
+
+
+# sentiment tokens
+# Lower case words of sentence as the pattern analyzer sees them
+def sentiment_tokens(sentence, lexicon):
+    return [word.lower() for word in ' '.join(lexicon['tokenizer'](sentence)).split()]
+
+
+# score tokens
+# The pattern analyzer's rules applied word by word: a known word is assessed on its own, or merged into the
+# assessment of a preceding adverb ("really good") whose intensity scales it, a preceding negation ("not good")
+# flips and halves the assessment's polarity, "!" boosts the last assessment and "(!)" and emoticons add their own
+# Returns (polarity, subjectivity) averaged over the assessments
+def score_tokens(words, lexicon):
+    index, emoticons = lexicon['index'], lexicon['emoticons']
+    assessments = []
+    modifier = negation = None
+    for word in words:
+        known = index.get(word)
+        if known is not None:
+            polarity, subjectivity, intensity = lexicon['scores'][known]
+            if modifier is None:
+                assessments.append([polarity, subjectivity, intensity, 1])
+            else:
+                last = assessments[-1]
+                last[0] = max(-1.0, min(polarity * last[2], +1.0))
+                last[1] = max(-1.0, min(subjectivity * last[2], +1.0))
+                last[2] = intensity
+            if negation is not None:
+                assessments[-1][2] = 1.0 / assessments[-1][2]
+                assessments[-1][3] = -1
+            modifier = word if lexicon['modifier'][known] else None
+            negation = word if word in lexicon['negations'] else None
+            continue
+        if word in lexicon['negations']:
+            negation = word
+        elif negation and len(word.strip("'")) > 1:
+            negation = None
+        if negation is not None and modifier is not None and modifier.endswith('ly'):
+            assessments[-1][3] = -1
+            negation = None
+        elif modifier and len(word) > 2:
+            modifier = None
+        if word == '!' and assessments:
+            assessments[-1][0] = max(-1.0, min(assessments[-1][0] * 1.25, +1.0))
+        if word == '(!)':
+            assessments.append([0.0, 1.0, 1.0, 1])
+        if not word.isalpha() and len(word) <= 5 and word not in lexicon['punctuation'] and word in emoticons:
+            assessments.append([emoticons[word], 1.0, 1.0, 1])
+    polarity = sum(p * -0.5 if n < 0 else p for p, _, _, n in assessments)
+    subjectivity = sum(s for _, s, _, _ in assessments)
+    return polarity / float(len(assessments) or 1), subjectivity / float(len(assessments) or 1)
+
+
+# score batch
+# Scores a list of sentences like TextBlob(sentence).sentiment, returns arrays of polarity and subjectivity
+# Sentences without negations, exclamation marks or emoticons are scored together with array operations: a known
+# word joins the assessment of the previous known word of its sentence when that word is an adverb and no unknown
+# word longer than two characters lies between them, and each assessment takes the scores of its last word scaled
+# by the intensity of the word before it. The other sentences go through score_tokens().
+def score_batch(sentences):
+    import numpy as np
+    lexicon = get_batch_lexicon()
+    polarity = np.zeros(len(sentences))
+    subjectivity = np.zeros(len(sentences))
+    tokens, token_sentences = [], []
+    for n, sentence in enumerate(sentences):
+        words = sentiment_tokens(sentence, lexicon)
+        if lexicon['sequential'].isdisjoint(words):
+            tokens.extend(words)
+            token_sentences.extend([n] * len(words))
+        else:
+            polarity[n], subjectivity[n] = score_tokens(words, lexicon)
+    if not tokens:
+        return polarity, subjectivity
+    # look up each distinct word once, unknown words get -1
+    vocabulary, inverse = np.unique(np.array(tokens), return_inverse=True)
+    position = np.minimum(np.searchsorted(lexicon['words'], vocabulary), len(lexicon['words']) - 1)
+    word_ids = np.where(lexicon['words'][position] == vocabulary, position, -1)[inverse.ravel()]
+    token_sentences = np.array(token_sentences)
+    lengths = np.fromiter(map(len, tokens), dtype=int, count=len(tokens))
+    breaks = np.cumsum((word_ids < 0) & (lengths > 2))
+    known = np.flatnonzero(word_ids >= 0)
+    if not len(known):
+        return polarity, subjectivity
+    known_ids = word_ids[known]
+    known_sentences = token_sentences[known]
+    merged = np.zeros(len(known), dtype=bool)
+    merged[1:] = ((known_sentences[1:] == known_sentences[:-1]) & lexicon['modifier'][known_ids[:-1]]
+                  & (breaks[known[1:]] == breaks[known[:-1]]))
+    last = np.ones(len(known), dtype=bool)
+    last[:-1] = ~merged[1:]
+    scale = np.ones(len(known))
+    scale[1:] = np.where(merged[1:], lexicon['intensity'][known_ids[:-1]], 1.0)
+    owners = known_sentences[last]
+    counts = np.bincount(owners, minlength=len(sentences))
+    simple = np.zeros(len(sentences), dtype=bool)
+    simple[token_sentences] = True
+    for scores, values in ((polarity, lexicon['polarity']), (subjectivity, lexicon['subjectivity'])):
+        assessed = np.clip(values[known_ids] * scale, -1.0, 1.0)[last]
+        totals = np.bincount(owners, weights=assessed, minlength=len(sentences)) / np.maximum(counts, 1)
+        scores[simple] = totals[simple]
+    return polarity, subjectivity
+
+
+"""
+TEXT ANALYSIS FUNCTIONS
+"""
+
+
+# iterate sentences
+# Splits the Text field (and Title with include_title=True) of each record into TextBlob sentences
+# Yields (record, sentence) pairs one article at a time, sentences are strings
+# Updated to skip near duplicates (see mark_duplicate())
+def iter_sentences(records, include_title=False, cache=None):
+    fields = ['Title', 'Text'] if include_title else ['Text']
+    for record in records:
+        if duplicate_of(record):
+            continue
+        for field in fields:
+            text = record.get(field)
+            if isinstance(text, str) and text:
+                for sentence in split_sentences(text, cache):
+                    yield record, sentence
+
+
+# Build matcher
+# Compiles patterns into one regular expression that reports every pattern occurring in a text in a single scan
+# The lookahead finds a match at every position and, with the longest patterns tried first, returns the longest
+# pattern starting there. Any other pattern starting at the same position is a prefix of it, so each pattern
+# carries the set of patterns it implies.
+def build_matcher(patterns):
+    patterns = sorted(set(patterns), key=len, reverse=True)
+    if patterns:
+        regex = re.compile('(?=(' + '|'.join(re.escape(pattern) for pattern in patterns) + '))')
+    else:
+        regex = re.compile('(?!)')
+    implied = {pattern: {other for other in patterns if pattern.startswith(other)} for pattern in patterns}
+    return {'regex': regex, 'implied': implied}
+
+
+# Match patterns
+# Returns the set of the matcher's patterns that occur in text (case sensitive, like the 'in' operator)
+def match_patterns(matcher, text):
+    found = set()
+    implied = matcher['implied']
+    for match in set(matcher['regex'].findall(text)):
+        found |= implied[match]
+    return found
+
+
+# get entity matcher
+def entity_matcher(topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES):
+    return build_matcher(list(entities) + ([topic] if topic else []))
+
+
+# Match sentence
+# Returns the entities mentioned by a sentence about topic (none if the sentence does not mention topic)
+def match_sentence(matcher, sentence, topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES):
+    found = match_patterns(matcher, sentence)
+    if not found or (topic and topic not in found):
+        return []
+    return [entity for entity in entities if entity in found]
+
+
+# score matches
+# Scores a list of (sentence_id, sentence, entities) matches with score_batch() and yields them with their scores
+def score_matches(matches):
+    if not matches:
+        return
+    polarity, subjectivity = score_batch([sentence['text'] for _, sentence, _ in matches])
+    for (sentence_id, sentence, mentioned), p, s in zip(matches, polarity, subjectivity):
+        yield sentence_id, sentence, mentioned, float(p), float(s)
+
+
+# iterate matches
+# Yields (sentence_id, sentence, entities, polarity, subjectivity) for every sentence of records that mentions topic
+# and at least one of entities, sentence_id counts every sentence of records from 0
+# counts['sentences'] is set to the number of sentences seen so far
+# With scorer='batch' matches are scored BATCH_SCORER_SIZE at a time by score_batch() instead of TextBlob, the
+# sentiment cache is then only used for the sentence splits
+def iter_matches(records, topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES, include_title=False, cache=None,
+                 counts=None, scorer='textblob'):
+    matcher = entity_matcher(topic, entities)
+    counts = {} if counts is None else counts
+    counts['sentences'] = 0
+    pending = []
+    for record, sentence in iter_sentences(records, include_title, cache):
+        sentence_id = counts['sentences']
+        counts['sentences'] += 1
+        mentioned = match_sentence(matcher, sentence, topic, entities)
+        if not mentioned:
+            continue
+        out_sentence = {'sentence_id': sentence_id, 'text': sentence, 'url': record.get('url'),
+                        'date': record.get('date')}
+        if scorer == 'batch':
+            pending.append((sentence_id, out_sentence, mentioned))
+            if len(pending) >= BATCH_SCORER_SIZE:
+                yield from score_matches(pending)
+                pending = []
+            continue
+        polarity, subjectivity = score_sentence(sentence, cache)
+        yield sentence_id, out_sentence, mentioned, polarity, subjectivity
+    yield from score_matches(pending)
+
+
+# Analyze chunk
+# Process pool worker for analyze_news(), analyses one chunk of records with a readonly sentiment cache
+# Returns the chunk's matches, its number of sentences, the new cache rows and the cache stats of the chunk
+def analyze_chunk(records, topic, entities, include_title, cache_path, scorer='textblob'):
+    cache = None
+    if cache_path and os.path.isfile(cache_path):
+        cache = open_sentiment_cache(cache_path, readonly=True)
+    start_stats = get_sentiment_cache_stats()
+    counts = {}
+    try:
+        matches = list(iter_matches(records, topic, entities, include_title, cache, counts, scorer))
+    finally:
+        if cache is not None:
+            cache['connection'].close()
+    stats = {key: value - start_stats[key] for key, value in get_sentiment_cache_stats().items()}
+    rows = cache['rows'] if cache is not None else {}
+    return matches, counts['sentences'], rows, stats
+
+
+# iterate chunks
+# Groups records into lists of chunk_size records
+def iter_chunks(records, chunk_size):
+    records = iter(records)
+    chunk = list(islice(records, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(records, chunk_size))
+
+
+# Analyze news
+# Splits the stored articles into sentences with TextBlob and keeps the sentences about topic
+# Returns a dict keyed by entity with the entity's topic sentences and their polarity and subjectivity
+# Updated to index all entities in one pass and to score each sentence only once
+# Updated to stream the Text fields of the stored articles (see iter_news_records()) rather than the raw JSON file,
+# each sentence is a dict of its text, sentence_id (position in the analysed text) and its article's url and date
+# Updated to use the sentiment cache unless cache=False, cache_path overrides its location
+# Updated to analyse chunks of chunk_size articles in a pool of workers processes when workers > 1, chunks are
+# merged in article order so the results are the same as with workers=1
+# Updated to score with the batch scorer when scorer='batch' (see score_batch())
+def analyze_news(file_path='news_dump_object.json', topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES,
+                 include_title=False, cache=True, cache_path=None, workers=1, chunk_size=32, scorer='textblob'):
+    results = {entity: {'sentences': [], 'polarity': [], 'subjectivity': []} for entity in entities}
+    cache_path = get_sentiment_cache_path(cache_path)
+    sentiment_cache = open_sentiment_cache(cache_path) if cache else None
+    start_stats = get_sentiment_cache_stats()
+
+    def add_match(sentence_id, out_sentence, mentioned, polarity, subjectivity):
+        for entity in mentioned:
+            results[entity]['sentences'].append(out_sentence)
+            results[entity]['polarity'].append(polarity)
+            results[entity]['subjectivity'].append(subjectivity)
+
+    try:
+        records = iter_news_records(file_path)
+        if workers <= 1:
+            for match in iter_matches(records, topic, entities, include_title, sentiment_cache, scorer=scorer):
+                add_match(*match)
+        else:
+            worker = partial(analyze_chunk, topic=topic, entities=entities, include_title=include_title,
+                             cache_path=cache_path if cache else None, scorer=scorer)
+            offset = 0
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for _, (matches, sentences, rows, stats) in iter_ordered(executor, worker,
+                                                                         iter_chunks(records, chunk_size),
+                                                                         2 * workers):
+                    for sentence_id, out_sentence, mentioned, polarity, subjectivity in matches:
+                        out_sentence['sentence_id'] = sentence_id + offset
+                        add_match(sentence_id + offset, out_sentence, mentioned, polarity, subjectivity)
+                    offset += sentences
+                    if sentiment_cache is not None:
+                        write_cache_rows(sentiment_cache, rows)
+                    for key, value in stats.items():
+                        sentiment_cache_stats[key] += value
+    finally:
+        close_sentiment_cache(sentiment_cache)
+    if cache:
+        stats = get_sentiment_cache_stats()
+        print('Sentiment cache:', stats['hits'] - start_stats['hits'], 'hits,',
+              stats['misses'] - start_stats['misses'], 'misses,',
+              stats['split_hits'] - start_stats['split_hits'], 'articles already split')
+    return results
+
+
+# Analysis frame
+# Turns analyze_news() results into one DataFrame with a row per entity mention: entity (categorical), sentence_id,
+# url, date (datetime64, NaT when missing), polarity, subjectivity and sentiment (polarity * subjectivity)
+def analysis_frame(results):
+    import numpy as np
+    import pandas as pd
+    entities = list(results)
+    sentences = [sentence for entity in entities for sentence in results[entity]['sentences']]
+    frame = pd.DataFrame({
+        'entity': pd.Categorical(np.repeat(np.array(entities, dtype=object),
+                                           [len(results[entity]['sentences']) for entity in entities]),
+                                 categories=entities),
+        'sentence_id': np.array([sentence['sentence_id'] for sentence in sentences], dtype=np.int64),
+        'url': pd.array([sentence['url'] for sentence in sentences], dtype='string'),
+        'date': pd.to_datetime(pd.Series([sentence['date'] for sentence in sentences], dtype=object),
+                               errors='coerce'),
+        'polarity': np.array([p for entity in entities for p in results[entity]['polarity']], dtype=np.float64),
+        'subjectivity': np.array([s for entity in entities for s in results[entity]['subjectivity']],
+                                 dtype=np.float64),
+    })
+    frame['sentiment'] = frame['polarity'] * frame['subjectivity']
+    return frame
+
+
+# Aggregate analysis
+# Groups an analysis_frame() by entity and date bucket, freq is a pandas frequency ('D', 'W', 'MS', ...) or None
+# for a single bucket over all dates (mentions without a date are only counted then)
+# Returns a DataFrame indexed by entity (and date) with the mentions and the mean polarity, subjectivity and
+# sentiment of each group
+def aggregate_analysis(frame, freq='D'):
+    import pandas as pd
+    if freq is None:
+        grouped = frame.groupby('entity', observed=False)
+    else:
+        grouped = frame.groupby(['entity', pd.Grouper(key='date', freq=freq)], observed=True)
+    return grouped.agg(mentions=('polarity', 'size'), polarity=('polarity', 'mean'),
+                       subjectivity=('subjectivity', 'mean'), sentiment=('sentiment', 'mean'))
+
+
+"""
+ANALYSIS AGGREGATES
+"""
+
+# Aggregate settings
+# The aggregates hold, for each entity and day, the number of mentions and the sum and sum of squares of each
+# metric. Sums are kept as exact fractions (strings in the JSON file) so adding articles in any order or in any
+# number of saves gives the same state as a rebuild.
+AGGREGATES_VERSION = 1
+AGGREGATE_METRICS = ['polarity', 'subjectivity', 'sentiment']
+UNDATED = 'undated'
+
+
+# aggregates path
+def aggregates_path(store_dir):
+    return os.path.join(store_dir, 'aggregates.json')
+
+
+# new aggregates
+# Empty aggregates for the analysis of topic and entities
+def new_aggregates(topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES, include_title=False):
+    return {'version': AGGREGATES_VERSION, 'topic': topic, 'entities': list(entities),
+            'include_title': include_title, 'articles': 0, 'days': {entity: {} for entity in entities}}
+
+
+# add mention
+# Adds one scored mention of entity on day to the aggregates
+def add_mention(aggregates, entity, day, polarity, subjectivity):
+    entry = aggregates['days'][entity].get(day)
+    if entry is None:
+        entry = {'count': 0}
+        for metric in AGGREGATE_METRICS:
+            entry[metric] = ['0', '0']
+        aggregates['days'][entity][day] = entry
+    entry['count'] += 1
+    values = {'polarity': polarity, 'subjectivity': subjectivity, 'sentiment': polarity * subjectivity}
+    for metric in AGGREGATE_METRICS:
+        value = Fraction(values[metric])
+        total, squares = entry[metric]
+        entry[metric] = [str(Fraction(total) + value), str(Fraction(squares) + value * value)]
+
+
+# Update aggregates
+# Analyses records (see iter_matches()) and adds their mentions to the aggregates
+def update_aggregates(aggregates, records, cache=None):
+    records = list(records)
+    for _, sentence, mentioned, polarity, subjectivity in iter_matches(records, aggregates['topic'],
+                                                                       aggregates['entities'],
+                                                                       aggregates['include_title'], cache):
+        day = store_date(sentence['date']) or UNDATED
+        for entity in mentioned:
+            add_mention(aggregates, entity, day, polarity, subjectivity)
+    aggregates['articles'] += len(records)
+    return aggregates
+
+
+# save aggregates
+def save_aggregates(aggregates, path):
+    write_store_file(path, [json.dumps(aggregates, sort_keys=True, indent=1) + '\n'])
+
+
+# load aggregates
+# Returns the aggregates saved at path, None if there are none
+def load_aggregates(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as in_file:
+            return json.load(in_file)
+    except (OSError, ValueError):
+        return None
+
+
+# Rebuild aggregates
+# Analyses every article of the store and replaces its aggregates, returns the new aggregates
+def rebuild_aggregates(store_dir, topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES, include_title=False,
+                       cache=True):
+    aggregates = new_aggregates(topic, entities, include_title)
+    sentiment_cache = open_sentiment_cache() if cache else None
+    try:
+        update_aggregates(aggregates, iter_store(store_dir), sentiment_cache)
+    finally:
+        close_sentiment_cache(sentiment_cache)
+    os.makedirs(store_dir, exist_ok=True)
+    save_aggregates(aggregates, aggregates_path(store_dir))
+    print(aggregates['articles'], 'articles aggregated in', aggregates_path(store_dir))
+    return aggregates
+
+
+# Open aggregates
+# Returns the store's aggregates, rebuilding them if they are missing or were made for another analysis
+def open_aggregates(store_dir, topic=ANALYSIS_TOPIC, entities=ANALYSIS_ENTITIES, include_title=False):
+    aggregates = load_aggregates(aggregates_path(store_dir))
+    expected = new_aggregates(topic, entities, include_title)
+    if aggregates is None or any(aggregates.get(key) != expected[key]
+                                 for key in ['version', 'topic', 'entities', 'include_title']):
+        print('NOTICE: building the analysis aggregates of', store_dir)
+        aggregates = rebuild_aggregates(store_dir, topic, entities, include_title)
+    return aggregates
+
+
+# Aggregates frame
+# Reports from the aggregates like aggregate_analysis(): days are summed into freq buckets (None for all dates,
+# mentions without a date are only counted then)
+# Returns a DataFrame indexed by entity (and date) with the mentions and the mean and standard deviation of each
+# metric
+def aggregates_frame(aggregates, freq='D'):
+    import numpy as np
+    import pandas as pd
+    rows = []
+    for entity, days in aggregates['days'].items():
+        for day, entry in days.items():
+            row = {'entity': entity, 'date': None if day == UNDATED else day, 'mentions': entry['count']}
+            for metric in AGGREGATE_METRICS:
+                row[metric + '_sum'] = float(Fraction(entry[metric][0]))
+                row[metric + '_squares'] = float(Fraction(entry[metric][1]))
+            rows.append(row)
+    sum_columns = [metric + suffix for metric in AGGREGATE_METRICS for suffix in ['_sum', '_squares']]
+    frame = pd.DataFrame(rows, columns=['entity', 'date', 'mentions'] + sum_columns)
+    frame['entity'] = pd.Categorical(frame['entity'], categories=aggregates['entities'])
+    frame['date'] = pd.to_datetime(frame['date'])
+    if freq is None:
+        totals = frame.groupby('entity', observed=False)[['mentions'] + sum_columns].sum()
+    else:
+        totals = frame.groupby(['entity', pd.Grouper(key='date', freq=freq)],
+                               observed=True)[['mentions'] + sum_columns].sum()
+        totals = totals[totals['mentions'] > 0]
+    report = totals[['mentions']].copy()
+    mentions = totals['mentions'].where(totals['mentions'] > 0)
+    for metric in AGGREGATE_METRICS:
+        report[metric] = totals[metric + '_sum'] / mentions
+    for metric in AGGREGATE_METRICS:
+        variance = totals[metric + '_squares'] / mentions - report[metric] ** 2
+        report[metric + '_std'] = np.sqrt(variance.clip(lower=0))
+    return report
+
+
+# Print analysis
+# Prints the mean polarity, mean subjectivity and number of mentions of each entity
+def print_analysis(results, topic_name='Coronavirus'):
+    import numpy as np
+    for entity, result in results.items():
+        print(entity, topic_name, "Polarity:", np.mean(result['polarity']))
+        print(entity, topic_name, "Sujectivity:", np.mean(result['subjectivity']))
+        print(entity, topic_name, "Mentions:", len(result['sentences']))
+
+
+"""
+EXECUTE SCRIPT
+"""
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Scrape the Reuters news and analyse it')
+    subparsers = parser.add_subparsers(dest='command')
+    rebuild_parser = subparsers.add_parser('rebuild-aggregates',
+                                           help='rebuild the analysis aggregates from the whole news store')
+    rebuild_parser.add_argument('news_object_file', nargs='?', default='news_dump_object.json')
+    dedupe_parser = subparsers.add_parser('dedupe', help='flag the near duplicates in the news store')
+    dedupe_parser.add_argument('news_object_file', nargs='?', default='news_dump_object.json')
+    dedupe_parser.add_argument('--collapse', action='store_true', help='also drop the text of the duplicates')
+    reextract_parser = subparsers.add_parser('reextract', help='extract the archived article pages again')
+    reextract_parser.add_argument('news_object_file', nargs='?', default='news_dump_object.json')
+    reextract_parser.add_argument('--workers', type=int, help='worker processes, default one per CPU')
+    search_parser = subparsers.add_parser('search', help='full text search of the news store')
+    search_parser.add_argument('query', help="FTS5 query, e.g. 'coronavirus AND Trump'")
+    search_parser.add_argument('--news-object', default='news_dump_object.json')
+    search_parser.add_argument('--from', dest='start', help='first date, YYYY-MM-DD')
+    search_parser.add_argument('--to', dest='end', help='last date, YYYY-MM-DD')
+    search_parser.add_argument('--source')
+    search_parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--profile', metavar='DIR', help='profile the scrape and the analysis into DIR')
+    args = parser.parse_args()
+    if args.command == 'search':
+        for result in search_news(args.query, args.news_object, args.start, args.end, args.source, args.limit):
+            print(result['date'], result['Title'])
+            print('   ', result['url'])
+            print('   ', result['snippet'])
+    elif args.command == 'rebuild-aggregates':
+        rebuild_aggregates(get_store_dir(args.news_object_file))
+    elif args.command == 'dedupe':
+        dedupe_store(get_store_dir(args.news_object_file), args.collapse)
+    elif args.command == 'reextract':
+        reextract_store(get_store_dir(args.news_object_file), args.workers)
+    else:
+        if args.profile:
+            start_profiling(args.profile)
+        try:
+            main(return_output=False)
+            with run_stage('analysis'):
+                print_analysis(analyze_news())
+        finally:
+            stop_profiling()